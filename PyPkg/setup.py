@@ -21,6 +21,13 @@ setup(
             "numpy",
             "pandas",
       ],
+      extras_require={
+            "dask": ["dask[dataframe]"],
+            "polars": ["polars>=1.0"],
+            "numba": ["numba"],
+            "duckdb": ["duckdb"],
+            "arrow": ["pyarrow>=14"],
+      },
       url = 'https://github.com/isaranwrap/StandardizingAKI',
       project_urls = {
             'Documentation': 'https://akiflagger.readthedocs.io/en/latest/',
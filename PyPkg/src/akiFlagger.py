@@ -1,10 +1,258 @@
 # Import libraries
-import pandas as pd
 import numpy as np
-import datetime, random
+import datetime, hashlib, importlib.util, itertools, json, os, re, sys
 
 __version__ = '1.1' # master file
 
+def _lazyImport(name):
+    '''
+    Returns a module that is only actually imported on first attribute access. Pandas takes up most of the time to import this
+    module, and the array-based paths (e.g. :meth:`AKIFlagger.returnAKIarrays`) never need it.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None: # Not installed; only an error once something actually needs it
+        return _MissingModule(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+class _MissingModule:
+    '''
+    Stand-in for a module that isn't installed (see :func:`_lazyImport`); raises an ImportError on first attribute access.
+    '''
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        raise ImportError("{0} is required for this part of akiFlagger, but is not installed; e.g. pip install {0}".format(self._name))
+
+pd = _lazyImport('pandas')
+
+_TIME_UNITS = {'w': 604800, 'week': 604800, 'weeks': 604800, 'd': 86400, 'day': 86400, 'days': 86400,
+               'h': 3600, 'hr': 3600, 'hrs': 3600, 'hour': 3600, 'hours': 3600,
+               'm': 60, 'min': 60, 'mins': 60, 'minute': 60, 'minutes': 60,
+               's': 1, 'sec': 1, 'secs': 1, 'second': 1, 'seconds': 1} # Seconds per unit
+
+def _toNanoseconds(value):
+    '''
+    Converts a time delta (e.g. '48hours', a datetime.timedelta or np.timedelta64) to integer nanoseconds. Simple '<number><unit>'
+    strings are parsed directly so that pandas need not be imported; any other format is passed on to pd.Timedelta.
+    '''
+    if isinstance(value, np.timedelta64):
+        return int(value.astype('timedelta64[ns]').astype('int64'))
+    elif isinstance(value, (int, np.integer)): # Integers are nanoseconds, as with pd.Timedelta
+        return int(value)
+    elif isinstance(value, str):
+        match = re.fullmatch(r'\s*([-+]?\d*\.?\d+)\s*([a-zA-Z]+)\s*', value)
+        if match and match.group(2).lower() in _TIME_UNITS:
+            return int(round(float(match.group(1))*_TIME_UNITS[match.group(2).lower()]*10**9))
+    elif isinstance(value, datetime.timedelta) and not hasattr(value, 'value'): # pd.Timedelta is a datetime.timedelta with a .value
+        return (value.days*86400 + value.seconds)*10**9 + value.microseconds*1000
+    return int(pd.Timedelta(value).value)
+
+class FlaggerInputError(AssertionError, ValueError):
+    '''
+    Raised when the input to the flagger is missing a column or has invalid values. Still an AssertionError for backwards
+    compatibility (the checks used to be assert statements), but raised explicitly so it is not stripped under ``python -O``.
+
+    Attributes:
+        rows (dict): Maps each failed check (e.g. 'creatinine is null') to the positions of the offending rows.
+    '''
+    def __init__(self, message, rows = None):
+        super().__init__(message)
+        self.rows = rows if rows is not None else {}
+
+def _raiseInvalidValues(checks, source = 'dataframe'):
+    '''
+    Raises a FlaggerInputError listing the offending rows (positions) of every failed check, if any; checks maps the description
+    of each check to a boolean mask of the rows failing it.
+    '''
+    rows = {check: np.flatnonzero(mask) for check, mask in checks.items() if np.any(mask)}
+    if rows:
+        message = '; '.join('{} at {} row(s) {}{}'.format(check, len(idx), idx[:10].tolist(), ' ...' if len(idx) > 10 else '')
+                            for check, idx in rows.items())
+        raise FlaggerInputError("Invalid values in the {}: {}".format(source, message), rows)
+
+def _arrowToNumpy(column):
+    '''
+    Returns an Arrow column as a NumPy array; view types (string_view, binary_view) are cast to the large types first, since
+    pyarrow cannot convert them to NumPy directly.
+    '''
+    import pyarrow as pa
+    kind = str(column.type)
+    if kind in ('string_view', 'binary_view'):
+        column = column.cast(pa.large_string() if kind == 'string_view' else pa.large_binary())
+    return column.to_numpy()
+
+RULE_REFERENCES = ('min', 'mean', 'first') # Statistics of the rolling window an AKIRule can compare against
+
+class AKIRule:
+    '''
+    One creatinine criterion of an AKI definition: a row gets `stage` if its creatinine is at least `ratio` times (or `increase`
+    mg/dL above) a reference statistic (by default the minimum) of the creatinine over the rolling `window` before it. A definition is a list of rules; every row gets the
+    highest stage whose rule it meets. See :data:`DEFINITIONS` for KDIGO, AKIN and RIFLE, and :meth:`AKIFlagger.returnAKIdefinitions`
+    to run definitions side by side.
+
+    Attributes:
+        stage (int): Stage a row gets if it meets the rule.
+        window (string): Rolling window of the reference minimum; e.g. '48hours'. Any time format accepted by pd.Timedelta(window) will work.
+        ratio (float): **default None.** Relative threshold; e.g. 1.5 for a 50% increase. Exactly one of ratio & increase is given.
+        increase (float): **default None.** Absolute threshold in mg/dL; e.g. 0.3.
+        at_least (float): **default None.** Additionally require the creatinine itself to be at least this value; e.g. 4.0.
+        reference (string): **default 'min'.** Statistic of the window's creatinine values (up to and including the row) the
+            threshold is relative to: 'min' (the rolling minimum, as in KDIGO), 'mean' or 'first' (the earliest value in the window).
+    '''
+    def __init__(self, stage, window, ratio = None, increase = None, at_least = None, reference = 'min'):
+        if (ratio is None) == (increase is None):
+            raise ValueError("Specify exactly one of ratio or increase for an AKI rule!")
+        if reference not in RULE_REFERENCES:
+            raise ValueError("The reference should be one of {}!".format(', '.join(map(repr, RULE_REFERENCES))))
+        self.stage = stage
+        self.window = window
+        self.ratio = ratio
+        self.increase = increase
+        self.at_least = at_least
+        self.reference = reference
+
+    def __repr__(self):
+        threshold = 'ratio = {}'.format(self.ratio) if self.ratio is not None else 'increase = {}'.format(self.increase)
+        at_least = ', at_least = {}'.format(self.at_least) if self.at_least is not None else ''
+        reference = ', reference = {!r}'.format(self.reference) if self.reference != 'min' else ''
+        return 'AKIRule({}, {!r}, {}{}{})'.format(self.stage, self.window, threshold, at_least, reference)
+
+# Creatinine criteria of the common AKI definitions. The windows are padded like cond1time & cond2time when compiled
+DEFINITIONS = {
+    'KDIGO': [AKIRule(1, '48hours', increase = 0.3), AKIRule(1, '168hours', ratio = 1.5),
+              AKIRule(2, '168hours', ratio = 2), AKIRule(3, '168hours', ratio = 3)],
+    'AKIN': [AKIRule(1, '48hours', increase = 0.3), AKIRule(1, '48hours', ratio = 1.5),
+             AKIRule(2, '48hours', ratio = 2), AKIRule(3, '48hours', ratio = 3),
+             AKIRule(3, '48hours', increase = 0.5, at_least = 4.0)],
+    'RIFLE': [AKIRule(1, '168hours', ratio = 1.5), AKIRule(2, '168hours', ratio = 2), AKIRule(3, '168hours', ratio = 3),
+              AKIRule(3, '168hours', increase = 0.5, at_least = 4.0)], # Risk, Injury & Failure
+}
+
+UMOL_PER_MGDL = 88.4 # Creatinine: 1 mg/dL is 88.4 µmol/L
+CREATININE_UNITS = {'mg/dl': 1.0, 'umol/l': 1/UMOL_PER_MGDL, 'mmol/l': 1000/UMOL_PER_MGDL}
+INPATIENT_VALUES = {'true': True, 't': True, 'yes': True, 'y': True, '1': True, '1.0': True, 'inpatient': True, 'ip': True, 'i': True,
+                    'false': False, 'f': False, 'no': False, 'n': False, '0': False, '0.0': False, 'outpatient': False, 'op': False, 'o': False}
+
+class InputNormalizer:
+    '''
+    Ingestion stage in front of :class:`AKIFlagger`, turning a site's lab extract into the flagger's input: it renames the source
+    columns, converts creatinine to mg/dL, normalizes the inpatient flags to booleans and parses the time stamps. Every step
+    works on the distinct values of a column (units and inpatient encodings have a handful, and repeated time stamps are parsed
+    once) and maps them back with the factorized codes, so nothing is done row by row. Time strings are parsed with a fixed
+    format, inferred once from the first value and reused for all the following chunks. For extracts too big for memory, normalize
+    them in chunks; e.g.
+
+    ``flagger.returnAKIpatients(pd.concat(normalizer.normalizeChunks(pd.read_csv(path, chunksize = 10**6))))``
+
+    Attributes:
+        schema (dict): **default None.** Maps the source column names to the flagger's; e.g. {'pat_mrn_id': 'patient_id'}.
+        creatinine_unit (string): **default 'mg/dL'.** Unit of the creatinine values ('mg/dL', 'umol/L' or 'mmol/L'), or the name
+            of a (renamed) column holding the unit of every row.
+        outpatient (string): **default None.** Name of an outpatient flag column (after renaming) to invert into the inpatient column.
+        time_format (string): **default None.** strftime format of the time strings; e.g. '%m/%d/%Y %H:%M'. Inferred if None.
+        flagger (AKIFlagger): **default None.** Flagger whose column names the output should have; the defaults if None.
+    '''
+    def __init__(self, schema = None, creatinine_unit = 'mg/dL', outpatient = None, time_format = None, flagger = None):
+        self.schema = dict(schema) if schema is not None else {}
+        self.creatinine_unit = creatinine_unit
+        self.outpatient = outpatient
+        self.time_format = time_format
+        flagger = flagger if flagger is not None else AKIFlagger()
+        self.patient_id, self.time = flagger.patient_id, flagger.time
+        self.creatinine, self.inpatient = flagger.creatinine, flagger.inpatient
+
+    def normalize(self, dataframe):
+        '''
+        Normalizes one dataframe (or chunk) of source data.
+
+        Args:
+            dataframe (pd.DataFrame): Source data.
+        Returns:
+            df (pd.DataFrame): The renamed data with creatinine in mg/dL, boolean inpatient flags and datetime64 time stamps.
+
+        Raises:
+            FlaggerInputError: If a unit or inpatient encoding isn't recognized, or the times don't match the format.
+        '''
+        df = dataframe.rename(columns = self.schema)
+
+        if self.creatinine_unit in df.columns:
+            factor = self._mapValues(df[self.creatinine_unit], self._unitFactor, '{} is not a known unit'.format(self.creatinine_unit))
+        else:
+            factor = self._unitFactor(self.creatinine_unit)
+            if factor is None:
+                raise FlaggerInputError("Unknown creatinine unit {!r}; should be one of 'mg/dL', 'umol/L' or 'mmol/L'!".format(self.creatinine_unit))
+        if factor is not None and np.any(factor != 1):
+            df[self.creatinine] = pd.to_numeric(df[self.creatinine]).values*factor
+
+        if self.outpatient is not None:
+            df[self.inpatient] = ~self._mapValues(df[self.outpatient], lambda value: INPATIENT_VALUES.get(self._key(value)),
+                                                  '{} is not a boolean encoding'.format(self.outpatient))
+        elif df[self.inpatient].dtype != bool:
+            df[self.inpatient] = self._mapValues(df[self.inpatient], lambda value: INPATIENT_VALUES.get(self._key(value)),
+                                                 '{} is not a boolean encoding'.format(self.inpatient))
+
+        if not pd.api.types.is_datetime64_any_dtype(df[self.time]):
+            times = df[self.time]
+            if self.time_format is None and times.notna().any():
+                self.time_format = self._guessFormat(str(times[times.notna()].iloc[0]))
+            try:
+                df[self.time] = pd.to_datetime(times, format = self.time_format, cache = True)
+            except (ValueError, TypeError) as error:
+                raise FlaggerInputError("Could not parse the {} column with format {!r}: {}".format(self.time, self.time_format, error))
+        return df
+
+    def normalizeChunks(self, chunks):
+        '''
+        Normalizes an iterable of chunks, e.g. from ``pd.read_csv(path, chunksize = ...)``, with the time format of the first.
+
+        Args:
+            chunks (iterable): Dataframes of source data.
+        Returns:
+            chunks (generator): The normalized dataframes.
+        '''
+        for chunk in chunks:
+            yield self.normalize(chunk)
+
+    @staticmethod
+    def _key(value):
+        return str(value).strip().lower()
+
+    @staticmethod
+    def _unitFactor(unit):
+        return CREATININE_UNITS.get(InputNormalizer._key(unit).replace('µ', 'u').replace('μ', 'u')) # Micro sign or Greek mu
+
+    @staticmethod
+    def _mapValues(column, lookup, check):
+        '''
+        Helper function mapping a column through `lookup` one distinct value at a time; raises a FlaggerInputError with the rows
+        of the values it doesn't recognize (None) under `check`.
+        '''
+        codes, uniques = pd.factorize(column, use_na_sentinel = False)
+        mapped = [lookup(value) for value in uniques]
+        unknown = np.array([value is None for value in mapped], dtype = 'bool')
+        if unknown.any():
+            rows = np.flatnonzero(unknown[codes])
+            raise FlaggerInputError("Invalid values in the dataframe: {} at {} row(s) (e.g. {!r})".format(check, len(rows), column.iloc[rows[0]]), {check: rows})
+        return np.array(mapped)[codes]
+
+    @staticmethod
+    def _guessFormat(value):
+        '''
+        Helper function inferring the strftime format of a time string, with the pandas parser's guesser.
+        '''
+        try:
+            from pandas.tseries.api import guess_datetime_format # pandas >= 2.2
+        except ImportError:
+            from pandas._libs.tslibs.parsing import guess_datetime_format
+        return guess_datetime_format(value)
+
 # Bulk logic (Main implementation switched from functional paradigm to class-based (i.e. OOP) in 2020) 
 class AKIFlagger:
     ''' Main logic to detect patients with acute kidney injury (AKI). This flagger returns patients with AKI according to the `KDIGO guidelines <https://kdigo.org/guidelines/>`_ on changes in creatinine\*. The KDIGO guidelines are as follows:
@@ -36,17 +284,38 @@ class AKIFlagger:
             eGFR-imputation method; i.e. assuming an eGFR of 75 estimate baseline creatinine based on age and sex. 
         
         cond1time (string): **default '48hours'.** The rolling-window time of the first KDIGO criterion condition.
-            This string gets passed to pd.Timedelta(cond1time), so any acceptable time format for that function will work.
+            Any time format accepted by pd.Timedelta(cond1time) will work; simple ones like '48hours' are parsed without pandas.
         cond2time (string): **default '168hours'.** The rolling-window time of the second KDIGO criterion condition.
-            This string gets passed to pd.Timedelta(cond2time), so any acceptable time format for that function will work.
+            Any time format accepted by pd.Timedelta(cond2time) will work; simple ones like '48hours' are parsed without pandas.
         pad1time (string): **default '0hours'.** Padding to add to the first KDIGO criterion condition.
-            This string gets passed to pd.Timedelta(pad1time), so any acceptable time format for that function will work.
+            Any time format accepted by pd.Timedelta(pad1time) will work; simple ones like '48hours' are parsed without pandas.
         pad2time (string): **default '0hours'.** Padding to add to the second KDIGO criterion condition.
-            This string gets passed to pd.Timedelta(pad2time), so any acceptable time format for that function will work.
+            Any time format accepted by pd.Timedelta(pad2time) will work; simple ones like '48hours' are parsed without pandas.
         
         sort_values (boolean): **default True.** Whether or not to sort the values within each encounter based on `time`.
+        duplicates (string): **default 'first'.** Which of the rows duplicated on (patient id, time) to keep when sorting: 'first' or
+            'last' in the input order, 'max' the one with the highest creatinine (the first of those on ties), or 'mean' the first
+            one with its creatinine replaced by the mean over the duplicates.
         add_baseline_creat (boolean): **default False.** Whether or not to add the baseline creatinine column from back-calculate method.
         add_min_creat (boolean): **default False.** Whether or not to add the minimum creatinine column from rolling-window method.
+        add_reference (boolean): **default False.** Whether or not to add the reference lab of every flag, i.e. what the creatinine was
+            compared against: 'reference' names it (the baseline creatinine column if the historical baseline trumped, else the
+            rolling minimum column), 'reference_time' is the time of the minimum lab (NaT for a baseline, which is a median) and
+            'reference_creat' its value. These are tracked as the argmin of the rolling windows in the same pass, so the array kernels
+            of the 'numpy' engine compute them when the engine is 'pandas' (the results are the same).
+
+        validate (boolean): **default True.** Whether or not to check the values of the input (null or non-positive creatinine,
+            non-datetime times, non-boolean inpatient values) before flagging. For trusted, pre-validated cohorts, save the scan by
+            setting this to False; the required columns are always checked.
+        prune (boolean): **default True.** Whether or not to skip the rolling windows for patients whose creatinine range can never
+            meet KDIGO (their max is below both min + 0.3 and 1.5 times min); these are stage 0 throughout. Only used when no
+            intermediate columns are requested; the output is the same either way.
+        engine (string): **default 'pandas'.** Which implementation computes the rolling minima, admissions, baselines and stages.
+            'pandas' uses grouped pandas operations; 'numpy' uses vectorized array kernels over the patient-sorted data; 'numba' runs
+            the same logic as a single compiled sweep over each patient, falling back to 'numpy' if numba is not installed.
+        num_threads (int): **default 1.** Number of threads the 'numpy' and 'numba' engines split the patients over. Each thread
+            sweeps a contiguous shard of the patient-sorted arrays in place, so nothing is copied or pickled; the compiled sweep
+            releases the GIL, and the NumPy kernels mostly do, so the shards run concurrently on multiple cores.
         
     '''
     def __init__(self, patient_id = 'patient_id', creatinine = 'creatinine', time = 'time', inpatient = 'inpatient', # Required columns
@@ -56,8 +325,8 @@ class AKIFlagger:
                  RM_window = True, HB_trumping = False, eGFR_impute = False, # Main parameters
                  cond1time = '48hours', cond2time = '168hours', pad1time = '0hours', pad2time = '0hours', # Rolling window sizes
                 sort_values = True, add_baseline_creat = False, add_min_creat = False, 
-                add_admission_col = False, add_imputed_encounter = False,
-                **defMapper): # Ancillary optional parameters (include output for intermediate calculations)
+                add_admission_col = False, add_imputed_encounter = False, add_reference = False, validate = True, prune = True, engine = 'pandas',
+                duplicates = 'first', num_threads = 1, **defMapper): # Ancillary optional parameters (include output for intermediate calculations)
         
         # Columns necessary for calculation
         self.patient_id = patient_id
@@ -78,8 +347,8 @@ class AKIFlagger:
             self.pad1time = padding
             self.pad2time = padding
 
-        self.cond1time = pd.Timedelta(cond1time) + pd.Timedelta(self.pad1time) + pd.Timedelta('1second') # Add one second to handle edge-cases (ex. exactly 48 hours)
-        self.cond2time = pd.Timedelta(cond2time) + pd.Timedelta(self.pad2time) + pd.Timedelta('1second')
+        self.cond1time = _toNanoseconds(cond1time) + _toNanoseconds(self.pad1time) + 10**9 # Add one second to handle edge-cases (ex. exactly 48 hours)
+        self.cond2time = _toNanoseconds(cond2time) + _toNanoseconds(self.pad2time) + 10**9
         
         # Historical baseline variables
         self.HB_trumping = HB_trumping
@@ -91,12 +360,45 @@ class AKIFlagger:
         self.add_imputed_encounter = add_imputed_encounter
         self.add_baseline_creat = add_baseline_creat
         self.add_min_creat = add_min_creat
+        self.add_reference = add_reference
 
         # Sort values - if the dataframe is already pre-sorted, save time by setting sort_values to False
         self.sort_values = sort_values
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError("Duplicates should be one of {}!".format(', '.join(map(repr, DUPLICATE_POLICIES))))
+        self.duplicates = duplicates
+
+        # Input validation - if the cohort has been validated before, save time by setting validate to False
+        self.validate = validate
+
+        # Pruning of patients with flat creatinine, who can never meet KDIGO
+        self.prune = prune
+
+        # Implementation used for the bulk of the calculation
+        if engine not in ('pandas', 'numpy', 'numba'):
+            raise ValueError("The engine should be one of 'pandas', 'numpy' or 'numba'!")
+        self.engine = engine
+        self.num_threads = num_threads
+
+    @property
+    def cond1time(self):
+        '''Rolling-window time of the first KDIGO criterion condition (including padding), as a pd.Timedelta.'''
+        return pd.Timedelta(self._cond1ns)
+
+    @cond1time.setter
+    def cond1time(self, value):
+        self._cond1ns = _toNanoseconds(value) # Kept in nanoseconds, s.t. the array-based paths never need to import pandas
+
+    @property
+    def cond2time(self):
+        '''Rolling-window time of the second KDIGO criterion condition (including padding), as a pd.Timedelta.'''
+        return pd.Timedelta(self._cond2ns)
+
+    @cond2time.setter
+    def cond2time(self, value):
+        self._cond2ns = _toNanoseconds(value)
         
-        
-    def returnAKIpatients(self, dataframe, cond1time = None, cond2time = None, pad1time = None, pad2time = None):
+    def returnAKIpatients(self, dataframe, cond1time = None, cond2time = None, pad1time = None, pad2time = None, start = None, end = None):
         '''
         Returns patients with AKI according to the `KDIGO guidelines <https://kdigo.org/guidelines/>`_ on changes in creatinine\*. The KDIGO guidelines are as follows:
 
@@ -108,31 +410,80 @@ class AKIFlagger:
         
         Args: 
             df (pd.DataFrame): Patient dataframe, should include some sort of patient and encounter identifier(s) and age, sex, race, serum creatinine and timestamps.
+                Other tables (e.g. pyarrow or polars) exposing the Arrow PyCapsule or DataFrame interchange protocol are passed on to :meth:`returnAKIpatientsArrow`.
+            start (datetime-like): **default None.** Only return the rows from this time on. Only the rows from :meth:`lookbackWindow`
+                are flagged, since nothing older can change the AKI flags of the rows returned.
+            end (datetime-like): **default None.** Only return the rows up to (and including) this time.
         Returns:
-            df (pd.DataFrame): Patient dataframe with AKI patients identified. 
+            df (pd.DataFrame): Patient dataframe with AKI patients identified (a pyarrow.Table for non-pandas input).
 
         Raises:
-            AssertionError: If the dataframe is missing an expected column; e.g. if there is no age/sex/race and eGFR_impute is True.
+            FlaggerInputError: If the dataframe is missing an expected column; e.g. if there is no age/sex/race and eGFR_impute is True,
+                or (if validate is True) has invalid values. This is a subclass of AssertionError.
 
         '''
-        ## Checks: we need to make sure the required columns are in the dataframe
-        assert self.patient_id in dataframe.columns or self.patient_id in dataframe.index.names, "Patient identifier missing!"
-        assert (self.time in dataframe.columns or self.time in dataframe.index.names), "Time column missing!"
-        assert (self.inpatient in dataframe.columns), "Inpatient/outpatient column missing!"
-        assert (self.creatinine in dataframe.columns), "Creatinine column missing!"
-        
-        assert not np.any(dataframe[self.creatinine].isnull()), "Get rid of any null creatinine values before running the flagger!"
-        
-        # Additional checks if we want to impute with eGFR ~ 75 method
-        if self.eGFR_impute:
-            assert (self.age in dataframe.columns), "If you are using the eGFR-based imputation method, you need to have an age, sex, and race column!"
-            assert (self.sex in dataframe.columns), "If you are using the eGFR-based imputation method, you need to have an age, sex, and race column!"
-            # assert (self.race in dataframe.columns), "If you are using the eGFR-based imputation method, you need to have an age, sex, and race column!" 2021 Update: No longer need race
+        if not isinstance(dataframe, pd.DataFrame) and (hasattr(dataframe, '__arrow_c_stream__') or hasattr(dataframe, '__dataframe__')):
+            return self.returnAKIpatientsArrow(dataframe, start = start, end = end)
+
+        ## Checks: we need to make sure the required columns are in the dataframe (and, unless switched off, that their values are valid)
+        self.validateInput(dataframe, check_values = self.validate)
+
+        window = None
+        if start is not None or end is not None: # Flag only the rows within the look-back window of [start, end]
+            times = dataframe[self.time] if self.time in dataframe.columns else dataframe.index.get_level_values(self.time)
+            lo, hi = self.lookbackWindow(start, end)
+            dataframe = dataframe[np.asarray((times >= lo) & (times <= hi))]
+            window = (lo if start is None else pd.Timestamp(start), hi if end is None else pd.Timestamp(end))
 
         # At this point, just want to make sure that the sex column is female. If sex is specified to be male, then change it 
         if self.sex == 'male' or self.sex == 'MALE': 
             dataframe[self.sex] = ~dataframe[self.sex].astype('bool')
 
+        df, patients = self._sortedInput(dataframe)
+
+        ## Step 3: Adding in AKI; patients whose creatinine range can never meet KDIGO skip the rolling windows altogether
+        intermediate = self.add_min_creat or self.add_reference or (self.HB_trumping and (self.add_admission_col or self.add_imputed_encounter or self.add_baseline_creat))
+        flat = self._flatPatientRows(df) if self.prune and not intermediate else None
+        if flat is not None and np.any(flat):
+            aki = pd.Series(0, index = df.index, name = 'aki')
+            if not np.all(flat):
+                aki[~flat] = self._returnAKIstages(df[~flat])['aki'].values
+            df = pd.concat([df, aki], axis=1)
+        else:
+            df = self._returnAKIstages(df)
+        df = self._restorePatientIds(df, patients)
+        if window is not None:
+            times = df.index.get_level_values(self.time)
+            df = df[(times >= window[0]) & (times <= window[1])]
+        return df
+
+    def lookbackWindow(self, start = None, end = None):
+        '''
+        Returns the time range of the rows needed to flag the rows in [start, end], i.e. (start - look-back, end + look-ahead). The
+        look-back is the longest rolling window (cond2time), plus with HB trumping the 365 days of the baseline and the 72 hours an
+        admission can take to establish. An older admission can only cover rows more than cond2time after it, which it doesn't
+        trump. With HB trumping, the look-ahead is also 72 hours, since a row is only an admission if the next one is inpatient.
+        For reading partitioned storage, push the range down as a filter; e.g.
+        ``pd.read_parquet(path, filters = [('time', '>=', lo), ('time', '<=', hi)])``. The AKI flags of [start, end] are exact;
+        intermediate columns (e.g. the imputed admission) of admissions starting before lo are not.
+
+        Args:
+            start (datetime-like): **default None.** Start of the reporting window; unbounded if None.
+            end (datetime-like): **default None.** End of the reporting window; unbounded if None.
+        Returns:
+            (lo, hi) (pd.Timestamp): Time range of the rows to read; pd.Timestamp.min/max if unbounded.
+        '''
+        lookback = max(self._cond1ns, self._cond2ns) + (ADMISSION_GAP + BASELINE_START if self.HB_trumping else 0)
+        lo = pd.Timestamp.min if start is None else pd.Timestamp(start) - pd.Timedelta(lookback)
+        hi = pd.Timestamp.max if end is None else pd.Timestamp(end) + pd.Timedelta(ADMISSION_GAP if self.HB_trumping else 0)
+        return lo, hi
+
+    def _sortedInput(self, dataframe):
+        '''
+        Steps 1 & 2 of :meth:`returnAKIpatients`: indexes the dataframe on patient id & time, sorts each patient's rows on time
+        and drops duplicates. Non-integer patient ids (e.g. string MRNs) are replaced by dense int32 codes, so the groupby's hash
+        integers rather than strings; returns (df, patients), where patients maps the codes back (None if the ids were kept).
+        '''
         ## Step 1: Set the index to patient id & time variables
         if dataframe.index.names != [self.patient_id, self.time]:
             try:
@@ -142,23 +493,91 @@ class AKIFlagger:
         else:
             df = dataframe.copy()
 
-        ## Step 2: Sort based on time and drop any duplicates
+        patients = None
+        ids = df.index.get_level_values(self.patient_id)
+        if not pd.api.types.is_integer_dtype(ids.dtype):
+            codes, patients = pd.factorize(ids, sort = True) # Sorted, s.t. imputed encounters number the same as with the ids
+            df.index = pd.MultiIndex.from_arrays([codes.astype('int32'), df.index.get_level_values(self.time)], names = df.index.names)
+
+        ## Step 2: Sort based on patient & time and reduce any duplicates in one stable pass
         if self.sort_values:
-            df = df.groupby(self.patient_id, sort=False, as_index = False).apply(lambda d: d.sort_index(level=self.time))
-            if df.index.names != [self.patient_id, self.time]: # Occassionally, the index is kept s.t. the index is [None, patient_id, time]
-                df = df.reset_index(level=0, drop=True) # This gets rid of the None index
-            df = df[~df.index.duplicated()] # Drop any duplicates
+            codes = np.asarray(df.index.get_level_values(self.patient_id)) # Integer ids or the sorted codes of Step 1
+            times = df.index.get_level_values(self.time).values.astype('datetime64[ns]').view('int64')
+            order = np.lexsort((times, codes))
+            rows, creat = _duplicateRows(codes[order], times[order], df[self.creatinine].values[order], self.duplicates)
+            df = df.iloc[order[rows]]
+            if self.duplicates == 'mean':
+                df = df.assign(**{self.creatinine: creat})
+        return df, patients
+
+    def _restorePatientIds(self, df, patients):
+        '''
+        Helper function mapping the int32 patient codes of :meth:`_sortedInput` back to the patient ids in the output.
+        '''
+        if patients is None:
+            return df
+        level = df.index.names.index(self.patient_id)
+        df.index = df.index.set_levels(patients.take(df.index.levels[level]), level = level, verify_integrity = False)
+        return df
+
+    def returnAKIdefinitions(self, dataframe, definitions):
+        '''
+        Returns the stages of several AKI definitions side by side (e.g. KDIGO next to AKIN and RIFLE, or KDIGO with other
+        thresholds). Each definition is a list of :class:`AKIRule`. The rules are compiled to the array kernels of the 'numpy'
+        engine: the window starts of every distinct window, and the reference statistic (see :class:`AKIRule`) of every distinct
+        (window, statistic) pair, are computed once and shared by all the definitions. Each rule is then a single vectorized comparison. Rolling windows are padded like cond1time & cond2time: a rule over the cond1time window
+        (e.g. KDIGO's 48 hours) by pad1time, any other by pad2time, plus one second. Historical baseline trumping is not part of
+        the rules, so it is not applied here.
+
+        Args:
+            dataframe (pd.DataFrame): Patient dataframe, as for :meth:`returnAKIpatients`.
+            definitions (dict): Maps the name of each output column to a definition. A definition is a list of rules, or the name
+                of one in :data:`DEFINITIONS`; e.g. {'kdigo': 'KDIGO', 'kdigo_0.5': [AKIRule(1, '48hours', increase = 0.5), ...]}.
+        Returns:
+            df (pd.DataFrame): Patient dataframe with a stage column per definition.
+        '''
+        self.validateInput(dataframe, check_values = self.validate)
+        df, patients = self._sortedInput(dataframe)
+        definitions = {name: DEFINITIONS[rules] if isinstance(rules, str) else rules for name, rules in definitions.items()}
+
+        codes = pd.factorize(df.index.get_level_values(self.patient_id))[0]
+        order = np.argsort(codes, kind = 'stable') # Make each patient's rows contiguous (keeping the time order within patients)
+        codes = codes[order]
+        times = df.index.get_level_values(self.time).values.astype('datetime64[ns]').view('int64')[order]
+        creat = df[self.creatinine].values.astype('float')[order]
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+
+        # Compile: one search of the window starts per distinct window, and one pass per distinct (window, statistic)
+        cond1 = self._cond1ns - _toNanoseconds(self.pad1time) - 10**9 # The unpadded cond1time
+        def padded(rule):
+            window = _toNanoseconds(rule.window)
+            return window + _toNanoseconds(self.pad1time if window == cond1 else self.pad2time) + 10**9
+        windows = {padded(rule) for rules in definitions.values() for rule in rules}
+        starts = {window: _segmentedSearchsorted(codes, times, codes, times - window, side = 'right') for window in windows}
+        references = {(padded(rule), rule.reference): None for rules in definitions.values() for rule in rules}
+        references = {key: _rollingReference(creat, starts[key[0]], key[1]) for key in references}
+
+        for name, rules in definitions.items():
+            compiled = [(rule, references[(padded(rule), rule.reference)]) for rule in rules]
+            df[name] = _evaluateRules(creat, compiled)[inverse]
+        return self._restorePatientIds(df, patients)
+
+    def _returnAKIstages(self, df):
+        '''
+        Step 3 of :meth:`returnAKIpatients`: adds the AKI column (and any intermediate columns) to the dataframe sorted by patient & time.
+        '''
+        if self.engine != 'pandas' or self.add_reference or len(df) == 0: # Pandas' rolling windows can't track the argmin (nor group no rows)
+            return self._returnAKIpatientsArrays(df)
 
-        ## Step 3: Adding in AKI
-        
         # Rolling minimum, first: 
         gb = df.loc[:, [self.creatinine]].reset_index(self.patient_id).groupby(self.patient_id, sort=False) # Groupby on patients
         min_creat48 = gb.rolling(self.cond1time).min().reindex(df.index)[self.creatinine] # Rolling 48hr minimum creatinine time series 
         min_creat7d = gb.rolling(self.cond2time).min().reindex(df.index)[self.creatinine] # Rolling 7day minimum creatinine time series
 
         if self.add_min_creat: # Add in min creat time series to the dataframe
-            df['min_creat{}'.format(self.cond1time.days*24 + self.cond1time.seconds // 3600)] = min_creat48
-            df['min_creat{}'.format(self.cond2time.days*24 + self.cond2time.seconds // 3600)] = min_creat7d
+            df[self._minCreatColumn(self.cond1time)] = min_creat48
+            df[self._minCreatColumn(self.cond2time)] = min_creat7d
 
         if self.HB_trumping: # Historical baseline "trumping" local minimum values
             df = self.addAdmissionEncounterColumns(df)
@@ -217,6 +636,115 @@ class AKIFlagger:
         # Concatenate and return output
         return pd.concat([df, aki], axis=1)
     
+    def _flatPatientRows(self, dataframe):
+        '''
+        Returns a boolean mask of the rows belonging to patients whose creatinine range can never meet KDIGO. Using a segmented
+        min/max reduction per patient, no value is >= 0.3 + the minimum or >= 1.5 times it. Since every rolling minimum is at
+        least the patient's minimum, these patients are stage 0 throughout. With HB trumping, a calculated baseline is a median of
+        the patient's own values, so it can't trigger either. A given baseline lowers the minimum, and with eGFR-based imputation,
+        patients with inpatient rows (who may have an admission with an imputed baseline) are never pruned.
+        '''
+        if len(dataframe) == 0: # Nothing to reduce (reduceat needs at least one row)
+            return np.zeros(0, dtype = 'bool')
+        codes = pd.factorize(dataframe.index.get_level_values(self.patient_id))[0]
+        order = np.argsort(codes, kind = 'stable')
+        starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+        creat = dataframe[self.creatinine].values.astype('float')[order]
+        lo, hi = np.minimum.reduceat(creat, starts), np.round(np.maximum.reduceat(creat, starts), decimals=4)
+
+        candidate = np.ones(len(starts), dtype = 'bool')
+        if self.HB_trumping and self.baseline_creat in dataframe.columns:
+            lo = np.fmin(lo, np.fmin.reduceat(dataframe[self.baseline_creat].values.astype('float')[order], starts)) # fmin ignores nulls
+        elif self.HB_trumping and self.eGFR_impute:
+            candidate = ~np.logical_or.reduceat(dataframe[self.inpatient].values.astype('bool')[order], starts)
+
+        flat = candidate & (hi < np.round(0.3 + lo, decimals=4)) & (hi < np.round(1.5*lo, decimals=4))
+        return flat[codes]
+
+    def validateInput(self, dataframe, check_values = True):
+        '''
+        Checks that the dataframe has the columns the flagger needs, and that their values are valid. Every value check is a
+        single vectorized pass over its column, and all the checks are run before raising, s.t. one error reports every offending
+        row at once (as positions, i.e. for use with .iloc):
+
+        * creatinine values which are null or non-positive
+        * time stamps which are null or not datetimes
+        * inpatient/outpatient values which are not booleans
+
+        Args:
+            dataframe (pd.DataFrame): Patient dataframe
+            check_values (boolean): **default True.** Whether or not to check the values; otherwise only the columns are checked.
+
+        Raises:
+            FlaggerInputError: If a column is missing or any value is invalid.
+        '''
+        columns = [self.patient_id, self.time, self.inpatient, self.creatinine]
+        names = ["Patient identifier", "Time column", "Inpatient/outpatient column", "Creatinine column"]
+        for column, name in zip(columns, names):
+            if column not in dataframe.columns and not (column in (self.patient_id, self.time) and column in dataframe.index.names):
+                raise FlaggerInputError("{} missing!".format(name))
+
+        # Additional checks if we want to impute with eGFR ~ 75 method (2021 Update: No longer need race)
+        if self.eGFR_impute and (self.age not in dataframe.columns or self.sex not in dataframe.columns):
+            raise FlaggerInputError("If you are using the eGFR-based imputation method, you need to have an age, sex, and race column!")
+
+        if not check_values:
+            return
+
+        creat = dataframe[self.creatinine]
+        time = dataframe[self.time] if self.time in dataframe.columns else dataframe.index.get_level_values(self.time)
+        inpatient = dataframe[self.inpatient]
+
+        checks = {'{} is null'.format(self.creatinine): creat.isnull().values}
+        if pd.api.types.is_numeric_dtype(creat) and not pd.api.types.is_bool_dtype(creat):
+            checks['{} is non-positive'.format(self.creatinine)] = (creat <= 0).values
+        else:
+            checks['{} is not numeric'.format(self.creatinine)] = np.ones(len(creat), dtype = 'bool')
+
+        if pd.api.types.is_datetime64_any_dtype(time):
+            checks['{} is null'.format(self.time)] = pd.isnull(time)
+        else:
+            checks['{} is not a datetime'.format(self.time)] = ~np.array([isinstance(t, (datetime.datetime, np.datetime64)) for t in time], dtype = 'bool')
+
+        if pd.api.types.is_bool_dtype(inpatient):
+            checks['{} is not boolean'.format(self.inpatient)] = np.zeros(len(inpatient), dtype = 'bool')
+        elif inpatient.dtype == object:
+            checks['{} is not boolean'.format(self.inpatient)] = ~inpatient.map(lambda x: isinstance(x, (bool, np.bool_))).values.astype('bool')
+        else:
+            checks['{} is not boolean'.format(self.inpatient)] = np.ones(len(inpatient), dtype = 'bool')
+
+        _raiseInvalidValues(checks)
+
+    def _validatePolars(self, lf, columns):
+        '''
+        Polars counterpart to :meth:`validateInput`, with the same checks and errors; the value checks are collected in one pass.
+        '''
+        import polars as pl
+
+        for column, name in zip([self.patient_id, self.time, self.inpatient, self.creatinine],
+                                ["Patient identifier", "Time column", "Inpatient/outpatient column", "Creatinine column"]):
+            if column not in columns:
+                raise FlaggerInputError("{} missing!".format(name))
+        if self.eGFR_impute and (self.age not in columns or self.sex not in columns):
+            raise FlaggerInputError("If you are using the eGFR-based imputation method, you need to have an age, sex, and race column!")
+        if not self.validate:
+            return
+
+        schema = lf.collect_schema()
+        creat, time, inpatient = pl.col(self.creatinine), pl.col(self.time), pl.col(self.inpatient)
+        exprs = {'{} is null'.format(self.creatinine): creat.is_null()}
+        if schema[self.creatinine].is_numeric():
+            exprs['{} is non-positive'.format(self.creatinine)] = (creat <= 0).fill_null(False)
+        else:
+            exprs['{} is not numeric'.format(self.creatinine)] = pl.repeat(True, pl.len())
+        if schema[self.time].is_temporal():
+            exprs['{} is null'.format(self.time)] = time.is_null()
+        else:
+            exprs['{} is not a datetime'.format(self.time)] = pl.repeat(True, pl.len())
+        exprs['{} is not boolean'.format(self.inpatient)] = inpatient.is_null() if schema[self.inpatient] == pl.Boolean else pl.repeat(True, pl.len())
+        masks = lf.select([expr.alias(check) for check, expr in exprs.items()]).collect()
+        _raiseInvalidValues({check: masks[check].to_numpy() for check in exprs})
+
     def addAdmissionEncounterColumns(self, dataframe):
         '''
         Returns the admission column. An admission date is defined as the *first* timestamp where 2 consecutive inpatient creatinine measurements occur within 72 hrs. Id est:
@@ -305,9 +833,7 @@ class AKIFlagger:
         # and if creat/kappa is > 1 then the equation simplifies to (creat/kappa)**alpha. Thus, we can replace the min(~)max(~)
         # statements with the following check:
         
-        creat = kappa
-        creat[creat_over_kappa < 1] = kappa*creat_over_kappa**(-1/1.200)
-        creat[creat_over_kappa >=1] = kappa*creat_over_kappa**(1/alpha)
+        creat = kappa*np.where(creat_over_kappa < 1, creat_over_kappa**(-1/1.200), creat_over_kappa**(1/alpha)) # Series or arrays
 
         return creat
 
@@ -360,25 +886,1793 @@ class AKIFlagger:
             dataframe.loc[dataframe[self.admission] == admn, self.baseline_creat] = dataframe[c1 & c2 & c3][self.creatinine].median()
             #dataframe[self.baseline_creat] = dataframe[self.baseline_creat].ffill().bfill()
         return dataframe
-    
-def generate_toy_data(num_patients = 100, num_encounters_range = (1, 3), num_time_range = (5,10), creat_scale = 0.3,
-                      include_demographic_info = False, date_range = None, time_delta_range = None, set_index = False, printMsg=True):
+
+    def _minCreatColumn(self, condtime):
         '''
-        Generates toy data for demonstrating how the flagger works.
+        Helper function to name the rolling minimum creatinine column for a given window; e.g. 'min_creat52' for a 52 hour window.
+        '''
+        return 'min_creat{}'.format(condtime.days*24 + condtime.seconds // 3600)
+
+    def _outputMeta(self, dataframe):
+        '''
+        Helper function returning an empty dataframe with the columns (and dtypes) :meth:`returnAKIpatients` produces for this
+        input, with patient id & time as regular columns. Used as the metadata for lazily-evaluated (i.e. partitioned) outputs.
+        '''
+        cols = [col for col in dataframe.columns if col not in (self.patient_id, self.time)]
+        meta = dataframe.loc[:, [self.patient_id, self.time] + cols].iloc[:0].copy()
+
+        if self.add_min_creat:
+            meta[self._minCreatColumn(self.cond1time)] = pd.Series(dtype='float')
+            meta[self._minCreatColumn(self.cond2time)] = pd.Series(dtype='float')
+        if self.HB_trumping:
+            if self.add_admission_col:
+                meta['imputed_admission'] = pd.Series(dtype='datetime64[ns]')
+            if self.add_imputed_encounter:
+                meta['imputed_encounter_id'] = pd.Series(dtype='Int64') # Nullable, as rows before the first admission have none
+            if self.add_baseline_creat and self.baseline_creat not in cols:
+                meta[self.baseline_creat] = pd.Series(dtype='float')
+        if self.add_reference:
+            meta['reference'] = pd.Series(dtype='object')
+            meta['reference_time'] = pd.Series(dtype='datetime64[ns]')
+            meta['reference_creat'] = pd.Series(dtype='float')
+        meta['aki'] = pd.Series(dtype='int64')
+        return meta
+
+    def returnAKIpatientsDask(self, ddf, npartitions = None):
+        '''
+        Returns patients with AKI from a partitioned `dask <https://docs.dask.org/>`_ dataframe, for cohorts that do not fit in memory.
+        The rows are first hash-partitioned on the patient identifier, so that every patient's full history lives in exactly one
+        partition (the rolling windows and baselines never look across patients), and :meth:`returnAKIpatients` is then mapped over
+        each partition. Dask has no MultiIndex, so the patient identifier and time are returned as regular columns.
+
+        The result is lazy; e.g. ``flagger.returnAKIpatientsDask(ddf).compute(scheduler='processes')`` runs it on the local
+        multi-process scheduler, and the same graph runs unchanged on a distributed cluster. Note that imputed encounter ids (if
+        requested) are numbered within each partition, so they are only unique in combination with the patient identifier.
 
         Args:
-            num_patients (int): integer, default 100.
-                Number of patients to generate
-            num_encounters_range (tuple): tuple, default (3, 10).
-                Number of encounters per patient will be randomly selected from a range between this tuple.
-            include_demographic_info (bool): boolean, default False. 
-                Whether or not to include the demographic information in the generated dataset
+            ddf (dask.dataframe.DataFrame): Patient dataframe, partitioned arbitrarily (a patient may be split across partitions).
+            npartitions (int): **default None.** Number of output partitions; keeps the input partition count if None.
+        Returns:
+            ddf (dask.dataframe.DataFrame): Patient dataframe with AKI patients identified.
+
+        Raises:
+            FlaggerInputError: If the input isn't a dask dataframe, or the patient identifier or time column is missing.
+        '''
+        import dask.dataframe as dd # Optional dependency; only needed for the partitioned flagger
 
+        if not isinstance(ddf, dd.DataFrame):
+            raise FlaggerInputError("Expected a dask dataframe; use returnAKIpatients for pandas dataframes!")
+        if ddf.index.name in (self.patient_id, self.time):
+            ddf = ddf.reset_index()
+        if self.patient_id not in ddf.columns:
+            raise FlaggerInputError("Patient identifier missing!")
+        if self.time not in ddf.columns:
+            raise FlaggerInputError("Time column missing!")
 
-        Returns
-            df (pd.DataFrame): dataframe with toy numbers to work with.
+        ddf = ddf.shuffle(on = self.patient_id, npartitions = npartitions) # Hash-partition s.t. patients are never split
+        meta = pd.DataFrame({col: pd.Series(dtype = dtype) for col, dtype in ddf.dtypes.items()})
+        return ddf.map_partitions(self._returnAKIpatientsPartition, meta = self._outputMeta(meta))
+
+    def _returnAKIpatientsPartition(self, partition):
+        '''
+        Helper function to flag a SINGLE partition (i.e. pipe through a map_partitions operation)
+        '''
+        if partition.shape[0] == 0: # Empty partitions are common after the shuffle when there are few patients
+            return self._outputMeta(partition)
+        df = self.returnAKIpatients(partition).reset_index()
+        if 'imputed_encounter_id' in df.columns:
+            df['imputed_encounter_id'] = df['imputed_encounter_id'].astype('Int64')
+        return df
+
+    def _settings(self):
+        '''
+        Helper function returning the flagger settings that affect the output, as strings; used to tell whether a checkpoint or
+        snapshot was written with the same configuration.
+        '''
+        neutral = ('admission', 'encounter_id', 'engine', 'num_threads', 'validate', 'prune') # Set while flagging, or don't change the output
+        return {key: repr(value) for key, value in sorted(vars(self).items()) if key not in neutral and not callable(value)}
+
+    def returnAKIpatientsCheckpointed(self, dataframe, directory, num_shards = 16, resume = True):
+        '''
+        Returns patients with AKI by flagging the cohort in patient shards, saving every completed shard (and a manifest of them)
+        to a local directory. If a long run is interrupted, calling this again with the same directory resumes from the completed
+        shards instead of starting over; the result is the same as that of an uninterrupted run.
+
+        Patients are split into contiguous shards in sorted patient id order, so the rows come back in the same order (sorted by
+        patient and time) as with :meth:`returnAKIpatients`. Note that imputed encounter ids (if requested) are numbered within each shard, so they are only
+        unique in combination with the patient identifier.
+
+        Args:
+            dataframe (pd.DataFrame): Patient dataframe, as for :meth:`returnAKIpatients`.
+            directory (str): Checkpoint directory; created if it does not exist.
+            num_shards (int): **default 16.** Number of patient shards (at most one per patient).
+            resume (boolean): **default True.** Whether or not to reuse the shards in the directory. Otherwise, they are re-flagged.
+        Returns:
+            df (pd.DataFrame): Patient dataframe with AKI patients identified.
+
+        Raises:
+            FlaggerInputError: If the dataframe is missing an expected column or has invalid values (see :meth:`validateInput`).
+            ValueError: If the directory holds the checkpoint of a different cohort or flagger configuration.
+        '''
+        if self.patient_id in dataframe.index.names or self.time in dataframe.index.names:
+            dataframe = dataframe.reset_index()
+        self.validateInput(dataframe, check_values = self.validate)
+
+        codes, uniques = pd.factorize(dataframe[self.patient_id], sort = True) # Codes in sorted patient order
+        num_shards = max(1, min(num_shards, len(uniques)))
+        shards = codes*num_shards // max(len(uniques), 1)
+
+        # The manifest identifies the run by its input & settings, s.t. a checkpoint is never resumed for something else
+        settings = self._settings()
+        fingerprint = hashlib.sha256(pd.util.hash_pandas_object(dataframe, index = False).values.tobytes()).hexdigest()
+        manifest = {'fingerprint': fingerprint, 'settings': settings, 'num_shards': num_shards, 'sharding': 'sorted', 'completed': {}}
+
+        os.makedirs(directory, exist_ok = True)
+        path = os.path.join(directory, 'manifest.json')
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if any(saved.get(key) != manifest[key] for key in ('fingerprint', 'settings', 'num_shards', 'sharding')):
+                raise ValueError("The checkpoint in {} is for a different cohort or flagger configuration!".format(directory))
+            manifest['completed'] = {shard: name for shard, name in saved['completed'].items()
+                                     if os.path.exists(os.path.join(directory, name))}
+
+        def atomicWrite(target, write): # Write to a temporary file first, s.t. a crash never leaves a truncated file behind
+            write(target + '.tmp')
+            os.replace(target + '.tmp', target)
+
+        order = np.argsort(shards, kind = 'stable')
+        starts = np.searchsorted(shards[order], np.arange(num_shards + 1))
+        outputs = []
+        for shard in range(num_shards):
+            name = 'shard{:05d}.pkl'.format(shard)
+            if str(shard) in manifest['completed']:
+                outputs.append(pd.read_pickle(os.path.join(directory, name)))
+                continue
+            output = self.returnAKIpatients(dataframe.iloc[order[starts[shard]:starts[shard + 1]]].copy()).reset_index()
+            atomicWrite(os.path.join(directory, name), output.to_pickle)
+            manifest['completed'][str(shard)] = name
+            def writeManifest(target):
+                with open(target, 'w') as f:
+                    json.dump(manifest, f, indent = 1)
+            atomicWrite(path, writeManifest)
+            outputs.append(output)
+
+        return pd.concat(outputs, ignore_index = True).set_index([self.patient_id, self.time])
+
+    def returnAKIpatientsPipelined(self, paths, outputs, read = None, write = None, normalizer = None, max_queued = 2):
+        '''
+        Flags a batch of files (e.g. a directory of daily extracts, each flagged on its own) with the reading, parsing, flagging and
+        writing of different files overlapped, instead of running them strictly in sequence. The four stages are asyncio tasks
+        connected by bounded queues, and each runs its blocking work in the default thread pool; so the disk is busy while the CPU
+        flags, and a stage that falls behind blocks the ones before it. At most 3*max_queued + 4 files are in memory at once, and
+        the throughput approaches that of the slowest stage.
+
+        Args:
+            paths (list): Input files.
+            outputs (list or str): Output file of every input, or a directory to write them to under the same file names.
+            read (callable): **default None.** Parses a file object holding the bytes of an input into a dataframe; pd.read_csv if None.
+            write (callable): **default None.** Writes a flagged dataframe to a path; DataFrame.to_csv if None.
+            normalizer (InputNormalizer): **default None.** Ingestion stage applied to every dataframe after parsing; if None, one
+                with the flagger's column names, which parses the time stamps and inpatient flags read from text.
+            max_queued (int): **default 2.** Capacity of the queues between stages.
+        Returns:
+            outputs (list): The output files, in the order of the inputs.
+        '''
+        import asyncio, io
+
+        paths = list(paths)
+        if isinstance(outputs, str):
+            outputs = [os.path.join(outputs, os.path.basename(path)) for path in paths]
+        read = read if read is not None else pd.read_csv
+        write = write if write is not None else (lambda df, path: df.to_csv(path))
+        normalizer = normalizer if normalizer is not None else InputNormalizer(flagger = self)
+
+        def readBytes(i, _):
+            with open(paths[i], 'rb') as file:
+                return file.read()
+        def parse(i, raw):
+            return normalizer.normalize(read(io.BytesIO(raw)))
+        def flag(i, df):
+            return self.returnAKIpatients(df)
+        def save(i, df):
+            write(df, outputs[i])
+
+        async def pipeline():
+            loop = asyncio.get_running_loop()
+            source = asyncio.Queue()
+            for i in range(len(paths)):
+                source.put_nowait((i, None))
+            source.put_nowait(None)
+            queues = [source] + [asyncio.Queue(max_queued) for _ in range(3)] + [None]
+
+            async def stage(func, inbox, outbox):
+                while True:
+                    item = await inbox.get()
+                    if item is None: # No more files
+                        break
+                    result = await loop.run_in_executor(None, func, *item)
+                    if outbox is not None:
+                        await outbox.put((item[0], result))
+                if outbox is not None:
+                    await outbox.put(None)
+
+            tasks = [asyncio.ensure_future(stage(func, inbox, outbox))
+                     for func, inbox, outbox in zip([readBytes, parse, flag, save], queues[:-1], queues[1:])]
+            try:
+                await asyncio.gather(*tasks)
+            finally: # If a stage fails, stop the others (which may be blocked on a full queue)
+                for task in tasks:
+                    task.cancel()
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(pipeline())
+        else: # Already inside an event loop (e.g. in Jupyter), so run the pipeline on a loop of its own
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers = 1) as pool:
+                pool.submit(asyncio.run, pipeline()).result()
+        return outputs
+
+    def returnAKIpatientsIncremental(self, flagged, dataframe):
+        '''
+        Re-flags a previously flagged cohort after new rows (e.g. one day of new creatinine results) are appended, without re-running
+        the flagger over the full history. Only patients with new rows are affected, and for each of them the watermark is their
+        earliest new time stamp. Flags before the watermark cannot change, since all the windows look backwards. With HB trumping
+        they are kept up to 72 hours before it, since a new inpatient row can turn the previous row into an admission.
+
+        The rows re-flagged are computed from a context that starts one rolling window (cond2time) before them. With HB trumping,
+        the context also covers the admission in effect plus its 365 day baseline window. The result is merged back into the flagged
+        cohort, so the cost scales with the new data and the look-back horizons rather than with the whole history.
+
+        Args:
+            flagged (pd.DataFrame): Output of :meth:`returnAKIpatients` (with the same flagger settings) for the existing cohort.
+            dataframe (pd.DataFrame): New rows, with the same columns as the original input.
+        Returns:
+            df (pd.DataFrame): The flagged cohort including the new rows. The AKI column (and rolling minima) are identical to
+            re-flagging everything from scratch; with duplicates = 'mean', a new draw at the time of an old row is averaged with the
+            old row's (already reduced) creatinine as a single draw. The intermediate admission/baseline columns (if requested) are
+            only recomputed for the re-flagged rows, so older rows before a patient's first admission keep their back-filled values.
+            Imputed encounter ids of the re-flagged rows are numbered within the context.
+        '''
+        new = dataframe.reset_index() if self.patient_id in dataframe.index.names else dataframe
+        self.validateInput(new, check_values = self.validate)
+        if len(new) == 0: # No new rows (e.g. a night without new labs); nothing changes
+            return flagged
+        old = flagged.reset_index()
+        columns = [col for col in new.columns if col in old.columns]
+
+        watermark = new.groupby(self.patient_id)[self.time].min()
+        affected = old[self.patient_id].isin(watermark.index).values
+        hist = pd.concat([old.loc[affected, columns], new.loc[:, columns]], ignore_index = True)
+
+        # Sort the affected patients' history by patient & time (old rows first on ties, as they were flagged first) and reduce
+        # the duplicates with the flagger's policy; an old row counts as a single draw (its creatinine is already reduced)
+        codes, patients = pd.factorize(hist[self.patient_id])
+        times = hist[self.time].values.astype('datetime64[ns]').view('int64')
+        order = np.lexsort((np.r_[np.zeros(affected.sum(), dtype = 'int64'), np.ones(new.shape[0], dtype = 'int64')], times, codes))
+        hist, codes, times = hist.iloc[order], codes[order], times[order]
+        keep, creat = _duplicateRows(codes, times, hist[self.creatinine].values, self.duplicates)
+        hist, codes, times = hist.iloc[keep], codes[keep], times[keep]
+        if self.duplicates == 'mean':
+            hist = hist.assign(**{self.creatinine: creat})
+
+        # Rows from `start` on get re-flagged; the context they're computed from starts at `context`
+        start = watermark.reindex(patients).values.astype('datetime64[ns]').view('int64')
+        context = start - max(self._cond1ns, self._cond2ns)
+        if self.HB_trumping:
+            start = start - ADMISSION_GAP
+            context = start - max(self._cond1ns, self._cond2ns)
+            bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+            admit, _ = _numpyAdmissions(bounds, times, hist[self.inpatient].values.astype('bool'))
+            first = _segmentedSearchsorted(codes, times, np.arange(len(patients)), start, side = 'left')
+            first_admit = admit[np.minimum(first, len(times) - 1)]
+            has_admit = (first < bounds[1:]) & (first_admit >= 0)
+            context = np.where(has_admit, np.minimum(context, times[first_admit]), context) - BASELINE_START
+
+        hist = hist[times >= context[codes]]
+        reflagged = self.returnAKIpatients(hist.reset_index(drop = True)).reset_index()
+        reflagged = reflagged[reflagged[self.time].values.astype('datetime64[ns]').view('int64') >= start[pd.Index(patients).get_indexer(reflagged[self.patient_id])]]
+
+        # Merge the re-flagged rows back in, keeping the original patient order
+        boundary = pd.Series(start, index = patients).reindex(old[self.patient_id]).values
+        kept = old[~affected | (old[self.time].values.astype('datetime64[ns]').view('int64') < boundary)]
+        out = pd.concat([kept, reflagged.loc[:, old.columns]], ignore_index = True)
+        rank = pd.Index(pd.unique(np.r_[old[self.patient_id].values, new[self.patient_id].values])).get_indexer(out[self.patient_id])
+        out = out.iloc[np.lexsort((out[self.time].values, rank))]
+        return out.set_index([self.patient_id, self.time])
+
+    def snapshotState(self, flagged, path):
+        '''
+        Writes a compact snapshot of the flagged cohort to disk, keeping only the rows :meth:`returnAKIpatientsIncremental` can still
+        need for new rows appended after each patient's latest time stamp. That is the last rolling window (cond2time), plus (with
+        HB trumping) the 72 hours an admission can reach back, the rows of the admission in effect, and the outpatient rows of the
+        365 day baseline window. A long-running flagger can write a snapshot after every batch and load it with
+        :meth:`restoreState` on restart, instead of replaying the full history.
+
+        Args:
+            flagged (pd.DataFrame): Output of :meth:`returnAKIpatients` or :meth:`returnAKIpatientsIncremental` for the cohort.
+            path (str): File to write the snapshot to; it is replaced atomically.
+        Returns:
+            df (pd.DataFrame): The rows kept in the snapshot.
+        '''
+        state = flagged.reset_index()
+        state = state.iloc[np.flatnonzero(self._horizonRows(state))].set_index([self.patient_id, self.time])
+        pd.to_pickle({'settings': self._settings(), 'state': state}, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return state
+
+    def restoreState(self, path):
+        '''
+        Loads a snapshot written by :meth:`snapshotState`. The result can be passed to :meth:`returnAKIpatientsIncremental` in place
+        of the full flagged cohort: the AKI flags of new rows appended after each patient's latest time stamp come out the same.
+
+        Args:
+            path (str): Snapshot file.
+        Returns:
+            df (pd.DataFrame): The flagged rows kept in the snapshot.
 
+        Raises:
+            ValueError: If the snapshot was written with different flagger settings.
+        '''
+        snapshot = pd.read_pickle(path)
+        if snapshot['settings'] != self._settings():
+            raise ValueError("The snapshot in {} was written with different flagger settings!".format(path))
+        return snapshot['state']
+
+    def _horizonRows(self, state):
+        '''
+        Helper function for :meth:`snapshotState`; returns a boolean mask of the rows within the look-back horizons of each patient's
+        latest time stamp. Older inpatient rows can be dropped even with HB trumping: no admission is in effect before the cut-off,
+        so none of them continue an admission.
+        '''
+        codes = pd.factorize(state[self.patient_id])[0]
+        order = np.lexsort((state[self.time].values.astype('datetime64[ns]').view('int64'), codes))
+        codes = codes[order]
+        times = state[self.time].values.astype('datetime64[ns]').view('int64')[order]
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True]) if len(codes) else np.zeros(1, dtype = 'int64')
+        last = times[bounds[1:] - 1]
+        window = max(self._cond1ns, self._cond2ns)
+
+        if not self.HB_trumping:
+            keep = times >= (last - window)[codes]
+        else:
+            start = last - ADMISSION_GAP # The earliest a new row can move the watermark of returnAKIpatientsIncremental to
+            inpatient = state[self.inpatient].values.astype('bool')[order]
+            admit, _ = _numpyAdmissions(bounds, times, inpatient)
+            first = _segmentedSearchsorted(codes, times, np.arange(len(last)), start, side = 'left')
+            first_admit = admit[np.minimum(first, len(times) - 1)]
+            cutoff = np.where((first < bounds[1:]) & (first_admit >= 0), np.minimum(start - window, times[first_admit]), start - window)
+            keep = (times >= cutoff[codes]) | (~inpatient & (times >= (cutoff - BASELINE_START)[codes]))
+
+        mask = np.empty(len(order), dtype = 'bool')
+        mask[order] = keep
+        return mask
+
+    def _returnAKIpatientsArrays(self, df):
+        '''
+        Array-based counterpart to Step 3 of :meth:`returnAKIpatients` (used when the engine is 'numpy' or 'numba'). The dataframe is
+        flattened into patient-contiguous, time-sorted arrays, the rolling minima, admissions and baselines are computed by the
+        kernels below in one pass, and the result is mapped back onto the original row order.
+        '''
+        codes, _ = pd.factorize(df.index.get_level_values(self.patient_id), sort = True) # Sorted codes, s.t. encounters number like pandas
+        order = np.argsort(codes, kind = 'stable') # Make each patient's rows contiguous (keeping the time order within patients)
+        codes = codes[order]
+        times, unit = _compactTimes(df.index.get_level_values(self.time).values.astype('datetime64[ns]').view('int64')[order])
+        creat = df[self.creatinine].values.astype('float')[order]
+        inpatient = df[self.inpatient].values.astype('bool')[order]
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True]) if len(codes) else np.zeros(1, dtype = 'int64')
+
+        compute_baseline = self.HB_trumping and self.baseline_creat not in df.columns
+        min1, min2, admit, baseline, arg1, arg2 = self._sweepArrays(bounds, times, creat, inpatient, compute_baseline, unit)
+
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+
+        if self.add_min_creat: # Add in min creat time series to the dataframe
+            df[self._minCreatColumn(self.cond1time)] = min1[inverse]
+            df[self._minCreatColumn(self.cond2time)] = min2[inverse]
+
+        if not self.HB_trumping:
+            aki = self._stageArrays(times, creat, min1, min2, return_reference = self.add_reference)
+            if self.add_reference:
+                aki, reference = aki
+                df = self._addReferenceColumns(df, reference, times.astype('int64')*unit, arg1, arg2, min1, min2, None, inverse)
+            return pd.concat([df, pd.Series(aki[inverse], index = df.index, name = 'aki')], axis=1)
+
+        self.admission = 'imputed_admission'
+        self.encounter_id = 'imputed_encounter_id'
+        admission = np.where(admit >= 0, times[admit].astype('int64')*unit, np.iinfo('int64').min) # int64 min is NaT
+        if self.add_admission_col:
+            df[self.admission] = admission[inverse].view('datetime64[ns]')
+        if self.add_imputed_encounter: # Numbered in (admission, patient) order, as in pandas' groupby().ngroup()
+            encounter = np.full(len(codes), np.nan)
+            has_admit = admit >= 0
+            if np.any(has_admit):
+                encounter[has_admit] = np.unique(np.stack([admission[has_admit], codes[has_admit]], axis = 1), axis = 0, return_inverse = True)[1].ravel()
+            df[self.encounter_id] = encounter[inverse]
+
+        if compute_baseline:
+            if self.eGFR_impute:
+                baseline = pd.Series(baseline[inverse], index = df.index)
+                imp = df.loc[baseline.isnull()]
+                female = ~imp[self.sex] if self.sex == 'male' else imp[self.sex]
+                baseline[baseline.isnull()] = self.eGFRbasedCreatImputation(imp[self.age], female)
+                baseline = baseline.values.astype('float')[order]
+            if self.add_baseline_creat:
+                df[self.baseline_creat] = baseline[inverse]
+        else:
+            baseline = df[self.baseline_creat].values.astype('float')[order]
+
+        aki = self._stageArrays(times, creat, min1, min2, admit, baseline, self.add_reference, unit)
+        if self.add_reference:
+            aki, reference = aki
+            df = self._addReferenceColumns(df, reference, times.astype('int64')*unit, arg1, arg2, min1, min2, baseline, inverse)
+        return pd.concat([df, pd.Series(aki[inverse], index = df.index, name = 'aki')], axis=1)
+
+    def _sweepArrays(self, bounds, times, creat, inpatient, compute_baseline, unit = 1):
+        '''
+        Helper function to run the per-patient sweep (rolling minima, admissions & baselines) with the configured engine. The times
+        are in units of `unit` nanoseconds (see :func:`_compactTimes`); the windows are rounded up to whole units, which keeps
+        (t - window, t] exact for time stamps on the unit grid.
         '''
+        sweep = _numbaSweep() if self.engine == 'numba' else None
+        if sweep is None:
+            sweep = _numpySweep
+        window1, window2 = -(-self._cond1ns // unit), -(-self._cond2ns // unit)
+        args = (window1, window2, self.HB_trumping, compute_baseline, self.add_reference, unit)
+        num_shards = min(self.num_threads, len(bounds) - 1)
+        if num_shards <= 1:
+            return sweep(bounds, times, creat, inpatient, *args)
+
+        # Contiguous shards of patients with about the same number of rows each; every thread writes its slice of the outputs
+        n = len(times)
+        shards = np.unique(bounds[np.searchsorted(bounds, np.linspace(0, n, num_shards + 1).astype('int64'), side = 'left')])
+        outputs = [np.empty(n), np.empty(n), np.empty(n, dtype = 'int64'), np.empty(n)] + \
+                  ([np.empty(n, dtype = 'int64'), np.empty(n, dtype = 'int64')] if self.add_reference else [None, None])
+        def run(lo, hi):
+            local = bounds[(bounds >= lo) & (bounds <= hi)] - lo
+            for out, result in zip(outputs, sweep(local, times[lo:hi], creat[lo:hi], inpatient[lo:hi], *args)):
+                if out is not None:
+                    out[lo:hi] = result if out.dtype != 'int64' else np.where(result >= 0, result + lo, result) # Row indices
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers = len(shards) - 1) as pool:
+            list(pool.map(run, shards[:-1], shards[1:]))
+        return tuple(outputs)
+
+    def _stageArrays(self, times, creat, min1, min2, admit = None, baseline = None, return_reference = False, unit = 1):
+        '''
+        Helper function to stage the sweep output; builds the admission masks (admission to +2 days and +7 days) for HB trumping.
+        '''
+        if not self.HB_trumping:
+            return _stageAKI(creat, min1, min2, return_reference = return_reference)
+        admission = np.where(admit >= 0, times[admit], 0)
+        mask2d = (admit >= 0) & (times >= admission) & (times <= admission + self._cond1ns // unit)
+        mask7d = (admit >= 0) & (times >= admission) & (times <= admission + self._cond2ns // unit)
+        return _stageAKI(creat, min1, min2, baseline, mask2d, mask7d, return_reference)
+
+    def _addReferenceColumns(self, df, reference, times, arg1, arg2, min1, min2, baseline, inverse):
+        '''
+        Helper function to add the reference columns (which value each stage was measured against, the time of that lab and its
+        creatinine) to the dataframe, from the staging & sweep output in patient-sorted order.
+        '''
+        names = np.array([None, self._minCreatColumn(self.cond1time), self._minCreatColumn(self.cond2time), self.baseline_creat], dtype = 'object')
+        row = np.select([reference == REFERENCE_MIN1, reference == REFERENCE_MIN2], [arg1, arg2], -1) # A baseline is not a single lab
+        df['reference'] = names[reference][inverse]
+        df['reference_time'] = np.where(row >= 0, times[row], np.iinfo('int64').min)[inverse].view('datetime64[ns]') # int64 min is NaT
+        df['reference_creat'] = np.select([reference == REFERENCE_MIN1, reference == REFERENCE_MIN2, reference == REFERENCE_BASELINE],
+                                          [min1, min2, np.nan if baseline is None else baseline], np.nan)[inverse]
+        return df
+
+    def returnAKIarrays(self, patient_id, time, creatinine, inpatient, baseline_creat = None, age = None, sex = None):
+        '''
+        Returns the AKI stage of every row given as plain arrays, using only NumPy (pandas is never imported). This is meant for
+        flagging small batches where the dataframe overhead dominates, e.g. one invocation per incoming lab. The logic is the same
+        as :meth:`returnAKIpatients` with the 'numpy' (or 'numba') engine: rows are sorted by patient and time, and duplicated
+        (patient, time) rows are reduced according to `duplicates` and all get the stage of the result.
+
+        Args:
+            patient_id (array-like): Patient identifiers.
+            time (array-like): Time stamps; anything np.asarray(time, dtype='datetime64[ns]') accepts.
+            creatinine (array-like): Creatinine values.
+            inpatient (array-like): Boolean inpatient/outpatient identifiers.
+            baseline_creat (array-like): **default None.** Baseline creatinine values for HB trumping; calculated if None.
+            age (array-like): **default None.** Ages, for eGFR-based imputation of the calculated baseline creatinine.
+            sex (array-like): **default None.** Values of the sex column, for eGFR-based imputation of the calculated baseline creatinine.
+        Returns:
+            aki (np.ndarray): AKI stage (0-3) of every row, in the input order.
+
+        Raises:
+            FlaggerInputError: If the arrays have different lengths or (if validate is True) invalid values.
+        '''
+        patient_id = np.asarray(patient_id)
+        times = np.asarray(time, dtype = 'datetime64[ns]')
+        creat = np.asarray(creatinine, dtype = 'float')
+        if not patient_id.shape == times.shape == creat.shape == np.shape(inpatient):
+            raise FlaggerInputError("All the arrays should have the same length!")
+        if baseline_creat is None and self.HB_trumping and self.eGFR_impute and (age is None or sex is None):
+            raise FlaggerInputError("Pass in the age & sex (or the baseline creatinine) to use eGFR-based imputation with arrays!")
+        if self.validate:
+            self._validateArrays(times, creat, inpatient)
+        times = times.view('int64')
+        inpatient = np.asarray(inpatient, dtype = 'bool')
+
+        # Sort by patient & time and reduce the duplicates, the same as the de-duplication in returnAKIpatients
+        codes = np.unique(patient_id, return_inverse = True)[1].ravel()
+        order = np.lexsort((times, codes))
+        codes, times = codes[order], times[order]
+        keep, creat = _duplicateRows(codes, times, creat[order], self.duplicates)
+        duplicate = np.r_[False, (codes[1:] == codes[:-1]) & (times[1:] == times[:-1])][:len(codes)]
+        rows = order[keep]
+        codes, times, inpatient = codes[keep], times[keep], inpatient[rows]
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True]) if len(codes) else np.zeros(1, dtype = 'int64')
+
+        times, unit = _compactTimes(times)
+        compute_baseline = baseline_creat is None
+        min1, min2, admit, baseline, _, _ = self._sweepArrays(bounds, times, creat, inpatient, compute_baseline, unit)
+        if not compute_baseline:
+            baseline = np.asarray(baseline_creat, dtype = 'float')[rows]
+        elif self.HB_trumping and self.eGFR_impute:
+            missing = np.isnan(baseline)
+            female = np.asarray(sex, dtype = 'bool')[rows][missing]
+            female = ~female if self.sex in ('male', 'MALE') else female
+            baseline[missing] = self.eGFRbasedCreatImputation(np.asarray(age, dtype = 'float')[rows][missing], female)
+        aki = self._stageArrays(times, creat, min1, min2, admit, baseline, unit = unit)
+
+        result = np.empty(len(order), dtype = 'int64')
+        result[order] = aki[np.cumsum(~duplicate) - 1]
+        return result
+
+    def _validateArrays(self, times, creat, inpatient):
+        '''
+        Value checks of :meth:`returnAKIarrays`: raises a FlaggerInputError listing the positions of the null or non-positive
+        creatinine values, null times and non-boolean inpatient values.
+        '''
+        checks = {'{} is null'.format(self.creatinine): np.isnan(creat), '{} is non-positive'.format(self.creatinine): creat <= 0,
+                  '{} is null'.format(self.time): np.isnat(times)}
+        inpatient = np.asarray(inpatient)
+        if inpatient.dtype == object: # E.g. booleans with nulls; only the non-boolean rows are invalid
+            checks['{} is not boolean'.format(self.inpatient)] = ~np.array([isinstance(x, (bool, np.bool_)) for x in inpatient], dtype = 'bool')
+        elif inpatient.dtype != bool:
+            checks['{} is not boolean'.format(self.inpatient)] = np.ones(len(creat), dtype = 'bool')
+        _raiseInvalidValues(checks, 'arrays')
+
+    def returnAKIpatientsArrow(self, table, start = None, end = None):
+        '''
+        Returns patients with AKI from any table exposing the `Arrow PyCapsule interface <https://arrow.apache.org/docs/format/CDataInterface/PyCapsuleInterface.html>`_
+        (``__arrow_c_stream__``; e.g. pyarrow tables, polars frames, DuckDB results) or the `DataFrame interchange protocol <https://data-apis.org/dataframe-protocol/latest/>`_
+        (``__dataframe__``), without converting it to pandas. The table is imported as Arrow, which is zero-copy for the usual
+        column types. Only the required columns (patient id, time, creatinine & inpatient; plus the baseline creatinine, age and sex
+        when HB trumping uses them) are read into NumPy and flagged with :meth:`returnAKIarrays`.
+
+        Args:
+            table (object): Patient table; any object with ``__arrow_c_stream__`` or ``__dataframe__``.
+            start (datetime-like): **default None.** Only return the rows from this time on; as for :meth:`returnAKIpatients`, only
+                the rows from :meth:`lookbackWindow` are flagged.
+            end (datetime-like): **default None.** Only return the rows up to (and including) this time.
+        Returns:
+            table (pyarrow.Table): The input columns (in the input row order) with the AKI column appended. Duplicated (patient, time)
+            rows are reduced according to `duplicates` and all get the stage of the result. The intermediate columns (e.g. add_min_creat) are not added.
+
+        Raises:
+            FlaggerInputError: If the table is missing an expected column or (if validate is True) has invalid values.
+        '''
+        import pyarrow as pa # Optional dependency; only needed for Arrow input/output
+
+        if not isinstance(table, pa.Table):
+            if type(table).__module__.split('.')[0] == 'polars' and hasattr(table, 'to_arrow'):
+                # polars exports strings as string_view, which pyarrow < 16 cannot read; ask for the plain (large) types instead
+                import polars as pl
+                table = table.to_arrow(compat_level = pl.CompatLevel.oldest()) if hasattr(pl, 'CompatLevel') else table.to_arrow()
+            elif hasattr(table, '__arrow_c_stream__'):
+                table = pa.table(table)
+            else:
+                import pyarrow.interchange
+                table = pyarrow.interchange.from_dataframe(table)
+
+        required = [self.patient_id, self.time, self.creatinine, self.inpatient]
+        for column, name in zip(required, ["Patient identifier", "Time column", "Creatinine column", "Inpatient/outpatient column"]):
+            if column not in table.column_names:
+                raise FlaggerInputError("{} missing!".format(name))
+
+        if start is not None or end is not None: # Flag only the rows within the look-back window of [start, end]
+            def within(table, lo, hi):
+                times = _arrowToNumpy(table[self.time]).astype('datetime64[ns]')
+                return pa.array((times >= lo) & (times <= hi))
+            if self.validate: # Validate the whole table, s.t. the positions of invalid rows refer to it rather than to the window
+                self._validateArrays(_arrowToNumpy(table[self.time]).astype('datetime64[ns]'), _arrowToNumpy(table[self.creatinine]).astype('float'),
+                                     _arrowToNumpy(table[self.inpatient]))
+            lo, hi = self.lookbackWindow(start, end)
+            table = self.returnAKIpatientsArrow(table.filter(within(table, lo.to_datetime64(), hi.to_datetime64())))
+            start, end = lo if start is None else pd.Timestamp(start), hi if end is None else pd.Timestamp(end)
+            return table.filter(within(table, start.to_datetime64(), end.to_datetime64()))
+
+        kwargs = {}
+        if self.HB_trumping and self.baseline_creat in table.column_names:
+            kwargs['baseline_creat'] = _arrowToNumpy(table[self.baseline_creat])
+        elif self.HB_trumping and self.eGFR_impute:
+            if self.age not in table.column_names or self.sex not in table.column_names:
+                raise FlaggerInputError("Age and sex columns needed for eGFR-based imputation!")
+            kwargs['age'], kwargs['sex'] = _arrowToNumpy(table[self.age]), _arrowToNumpy(table[self.sex])
+
+        aki = self.returnAKIarrays(*[_arrowToNumpy(table[column]) for column in required], **kwargs)
+        return table.append_column('aki', pa.array(aki))
+
+    def returnAKIpatientsPolars(self, frame):
+        '''
+        Returns patients with AKI from a `polars <https://pola.rs/>`_ (lazy) dataframe, without converting it to pandas. This backend
+        follows the same steps as :meth:`returnAKIpatients` - sorting & de-duplicating, rolling minima, admission imputation, baseline
+        creatinine and KDIGO staging - but expresses each as a polars expression, so the whole query is planned and executed by polars.
+
+        The patient identifier and time are returned as regular columns (polars has no index), sorted by patient and time.
+
+        Args:
+            frame (pl.DataFrame or pl.LazyFrame): Patient dataframe with the same columns :meth:`returnAKIpatients` expects.
+        Returns:
+            frame (pl.DataFrame or pl.LazyFrame): Patient dataframe with AKI patients identified; lazy if the input was lazy.
+
+        Raises:
+            FlaggerInputError: If the dataframe is missing an expected column or (if validate is True) has invalid values, as for
+                :meth:`validateInput`. This is a subclass of AssertionError.
+        '''
+        import polars as pl # Optional dependency; only needed for the polars backend
+
+        lazy = isinstance(frame, pl.LazyFrame)
+        lf = frame.lazy()
+        columns = lf.collect_schema().names()
+
+        ## Checks: we need to make sure the required columns are in the dataframe (and, unless switched off, that their values are valid)
+        self._validatePolars(lf, columns)
+
+        ## Step 1 & 2: Sort based on time and drop any duplicates
+        lf = lf.select([self.patient_id, self.time] + [col for col in columns if col not in (self.patient_id, self.time)])
+        if self.sort_values:
+            keys = [self.patient_id, self.time]
+            if self.duplicates == 'max': # Highest creatinine first within each (patient, time); the sort is stable
+                lf = lf.sort(keys + [self.creatinine], descending = [False, False, True], maintain_order = True)
+            else:
+                lf = lf.sort(keys, maintain_order = True)
+            if self.duplicates == 'mean':
+                lf = lf.with_columns(pl.col(self.creatinine).mean().over(keys))
+            lf = lf.unique(subset = keys, keep = 'last' if self.duplicates == 'last' else 'first', maintain_order = True)
+
+        ## Step 3: Adding in AKI
+        time, creat = pl.col(self.time), pl.col(self.creatinine)
+        min1, min2 = self._minCreatColumn(self.cond1time), self._minCreatColumn(self.cond2time)
+        lf = lf.with_columns(creat.rolling_min_by(self.time, window_size = self.cond1time.to_pytimedelta()).over(self.patient_id).alias(min1),
+                             creat.rolling_min_by(self.time, window_size = self.cond2time.to_pytimedelta()).over(self.patient_id).alias(min2))
+
+        creat = creat.round(4)
+        c1 = creat >= (0.3 + pl.col(min1)).round(4)
+        c2 = creat >= (1.5*pl.col(min2)).round(4)
+        stage2 = creat >= (2*pl.col(min2)).round(4)
+        stage3 = creat >= (3*pl.col(min2)).round(4)
+
+        if self.HB_trumping: # Historical baseline "trumping" local minimum values
+            admission, encounter_id = 'imputed_admission', 'imputed_encounter_id'
+            lf = self._addAdmissionEncounterColumnsPolars(lf)
+            if self.baseline_creat not in columns:
+                lf = self._addBaselineCreatPolars(lf)
+            baseline = pl.col(self.baseline_creat)
+
+            mask2d = ((time >= pl.col(admission)) & (time <= pl.col(admission) + self.cond1time.to_pytimedelta())).fill_null(False)
+            mask7d = ((time >= pl.col(admission)) & (time <= pl.col(admission) + self.cond2time.to_pytimedelta())).fill_null(False)
+            mask_bc = baseline.is_not_null()
+
+            aki = stage3.cast(pl.Int64) + stage2.cast(pl.Int64) + c2.cast(pl.Int64) # Stage 1 is just condition 2 here; condition 1 is added back in below
+            stage1hb = (creat >= (0.3 + baseline).round(4)) | (creat >= (1.5*baseline).round(4))
+            akihb = (creat >= (3*baseline).round(4)).cast(pl.Int64) + (creat >= (2*baseline).round(4)).cast(pl.Int64) + stage1hb.cast(pl.Int64)
+            aki = pl.when(mask7d & mask_bc).then(akihb).otherwise(aki)
+            aki = pl.when((aki == 0) & (~mask2d | ~mask_bc)).then((c1 | c2).cast(pl.Int64)).otherwise(aki) # Add back in the 0.3 bump criterion
+            lf = lf.with_columns(aki.alias('aki'))
+
+            drop = []
+            if not self.add_admission_col:
+                drop.append(admission)
+            if not self.add_imputed_encounter:
+                drop.append(encounter_id)
+            if not self.add_baseline_creat and self.baseline_creat not in columns:
+                drop.append(self.baseline_creat)
+            lf = lf.drop(drop)
+
+        else: # Vanilla rolling minimum if no HB trumping
+            lf = lf.with_columns((stage3.cast(pl.Int64) + stage2.cast(pl.Int64) + (c1 | c2).cast(pl.Int64)).alias('aki'))
+
+        if not self.add_min_creat:
+            lf = lf.drop([min1, min2])
+
+        return lf if lazy else lf.collect()
+
+    def _addAdmissionEncounterColumnsPolars(self, lf):
+        '''
+        Polars counterpart to :meth:`addAdmissionEncounterColumns`; adds the imputed admission and encounter columns to a lazy frame
+        sorted by patient and time.
+        '''
+        import polars as pl
+
+        admission, encounter_id = 'imputed_admission', 'imputed_encounter_id'
+        time, inpatient = pl.col(self.time), pl.col(self.inpatient)
+
+        # Admission is defined as the first timestamp where two consecutive inpatient creatinine measurements are <= 72 hours apart
+        cond1 = (time.shift(-1) - time <= datetime.timedelta(hours=72)).fill_null(False)
+        cond2 = inpatient & inpatient.shift(-1).fill_null(True)
+        lf = lf.with_columns((cond1 & cond2).over(self.patient_id).alias('c1c2'))
+        admit_mask = pl.col('c1c2') & ~pl.col('c1c2').shift(1, fill_value = False)
+        admit = pl.when(admit_mask).then(time).otherwise(None).forward_fill().backward_fill()
+        lf = lf.with_columns(admit.over(self.patient_id).alias(admission)).drop('c1c2')
+
+        # Encounter column imputation; numbered in (admission, patient) order, as in pandas' groupby().ngroup()
+        encounters = (lf.select([admission, self.patient_id]).drop_nulls().unique().sort([admission, self.patient_id])
+                        .with_row_index(encounter_id).with_columns(pl.col(encounter_id).cast(pl.Int64)))
+        return lf.join(encounters, on = [admission, self.patient_id], how = 'left', maintain_order = 'left')
+
+    def _addBaselineCreatPolars(self, lf):
+        '''
+        Polars counterpart to :meth:`addBaselineCreat`; adds the baseline creatinine (median of outpatient values from 365 to 7 days
+        prior to admission) to a lazy frame that already has the imputed admission column.
+        '''
+        import polars as pl
+
+        admission = 'imputed_admission'
+        admissions = lf.select([self.patient_id, admission]).drop_nulls().unique()
+        outpatient = lf.filter(~pl.col(self.inpatient)).select([self.patient_id, self.time, self.creatinine])
+        baseline = (admissions.join(outpatient, on = self.patient_id)
+                              .filter(pl.col(self.time).is_between(pl.col(admission) - datetime.timedelta(days=365),
+                                                                   pl.col(admission) - datetime.timedelta(days=7)))
+                              .group_by([self.patient_id, admission]).agg(pl.col(self.creatinine).median().alias(self.baseline_creat)))
+        lf = lf.join(baseline, on = [self.patient_id, admission], how = 'left', maintain_order = 'left')
+
+        if self.eGFR_impute:
+            female = pl.col(self.sex).cast(pl.Boolean)
+            if self.sex in ('male', 'MALE'):
+                female = ~female
+            female, age = female.cast(pl.Float64), pl.col(self.age).cast(pl.Float64)
+            kappa = 0.9 - 0.2*female
+            alpha = -0.302 + 0.061*female
+            creat_over_kappa = 75/(142*(1 + 0.012*female)*0.9938**age)
+            imputed = pl.when(creat_over_kappa < 1).then(kappa*creat_over_kappa**(-1/1.200)).otherwise(kappa*creat_over_kappa**(1/alpha))
+            lf = lf.with_columns(pl.col(self.baseline_creat).fill_null(imputed))
+        return lf
+
+    def returnAKIpatientsSQL(self, table, connection = None):
+        '''
+        Returns patients with AKI using an embedded `DuckDB <https://duckdb.org/>`_ database, so the cohort never has to be
+        materialized in Python. The KDIGO logic is a single query of window functions: the rolling minima are RANGE frames over
+        the cond1time and cond2time windows, admissions are imputed with LEAD/LAG over each patient's measurements and the
+        baseline creatinine is a windowed median of the outpatient values from 365 to 7 days before each admission.
+
+        Args:
+            table (str or object): Name of a table or view in the connection, a DuckDB relation, or anything DuckDB can scan
+                directly (e.g. a pandas or polars dataframe, or an Arrow table). Anything but a name is registered in the connection
+                as a view with a name of its own, so results of earlier calls keep reading their own input.
+            connection (duckdb.DuckDBPyConnection): **default None.** Connection holding the table; the default connection if None.
+        Returns:
+            relation (duckdb.DuckDBPyRelation): Lazily-evaluated relation with the AKI column, sorted by patient and time. Call .df(),
+            .arrow() or .pl() on it to fetch the result, or query it further. Of rows duplicated on (patient, time), the one with the
+            highest creatinine is kept for 'max' and one with the mean creatinine for 'mean'; SQL tables have no row order, so for
+            'first' and 'last' an arbitrary one is kept.
+        '''
+        import duckdb # Optional dependency; only needed for the SQL backend
+
+        con = connection if connection is not None else duckdb.default_connection()
+        if not isinstance(table, str):
+            name = 'akiflagger_input_{}'.format(next(_SQL_INPUTS))
+            if isinstance(table, duckdb.DuckDBPyRelation):
+                table.create_view(name)
+            else:
+                con.register(name, table)
+            table = name
+
+        columns = con.table(table).columns
+        for column, name in zip([self.patient_id, self.time, self.inpatient, self.creatinine],
+                                ["Patient identifier", "Time column", "Inpatient/outpatient column", "Creatinine column"]):
+            if column not in columns:
+                raise FlaggerInputError("{} missing!".format(name))
+
+        quote = lambda name: '"{}"'.format(name.replace('"', '""'))
+        pid, time, inp, creat = quote(self.patient_id), quote(self.time), quote(self.inpatient), quote(self.creatinine)
+        patient = 'PARTITION BY {} ORDER BY {}'.format(pid, time)
+        r4 = lambda expr: 'ROUND_EVEN({}, 4)'.format(expr) # Same half-to-even rounding as np.round
+        # RANGE frames include both ends, whereas the pandas rolling windows exclude (t - window); hence the extra microsecond
+        preceding = lambda ns: 'INTERVAL ({}) MICROSECONDS PRECEDING'.format(ns // 1000 - 1)
+        cond1 = '{} >= {}'.format(r4(creat), r4('0.3 + min1'))
+        cond2 = '{} >= {}'.format(r4(creat), r4('1.5*min2'))
+        stage = lambda ref, stage1: '({} >= {})::INT + ({} >= {})::INT + ({})::INT'.format(r4(creat), r4('3*' + ref),
+                                                                                             r4(creat), r4('2*' + ref), stage1)
+
+        if self.duplicates == 'mean':
+            source = '(SELECT * REPLACE (AVG({creat}) OVER (PARTITION BY {pid}, {time}) AS {creat}) FROM {table})'.format(
+                creat = creat, pid = pid, time = time, table = quote(table))
+        else:
+            source = quote(table)
+        ctes = ['''dedup AS (SELECT * FROM {source} QUALIFY ROW_NUMBER() OVER (PARTITION BY {pid}, {time}{order}) = 1)'''.format(
+                    source = source, pid = pid, time = time, order = ' ORDER BY {} DESC'.format(creat) if self.duplicates == 'max' else ''),
+                '''rolling AS (SELECT *, MIN({creat}) OVER ({patient} RANGE BETWEEN {w1} AND CURRENT ROW) AS min1,
+                                         MIN({creat}) OVER ({patient} RANGE BETWEEN {w2} AND CURRENT ROW) AS min2
+                               FROM dedup)'''.format(creat = creat, patient = patient,
+                                                     w1 = preceding(self._cond1ns), w2 = preceding(self._cond2ns))]
+        extra = []
+        if self.add_min_creat:
+            extra += ['min1 AS {}'.format(quote(self._minCreatColumn(self.cond1time))),
+                      'min2 AS {}'.format(quote(self._minCreatColumn(self.cond2time)))]
+
+        if self.HB_trumping:
+            ctes += ['''flags AS (SELECT *, COALESCE({inp} AND COALESCE(LEAD({inp}) OVER ({patient}), TRUE)
+                                                  AND LEAD({time}) OVER ({patient}) - {time} <= INTERVAL 72 HOURS, FALSE) AS c1c2
+                                  FROM rolling)'''.format(inp = inp, time = time, patient = patient),
+                     '''admits AS (SELECT *, c1c2 AND NOT COALESCE(LAG(c1c2) OVER ({patient}), FALSE) AS admit,
+                                          MEDIAN(CASE WHEN NOT {inp} THEN {creat} END) OVER ({patient} RANGE BETWEEN
+                                              INTERVAL 365 DAYS PRECEDING AND INTERVAL 7 DAYS PRECEDING) AS hb
+                                   FROM flags)'''.format(inp = inp, creat = creat, patient = patient),
+                     '''admissions AS (SELECT *, COALESCE(
+                                           LAST_VALUE(CASE WHEN admit THEN {time} END IGNORE NULLS)
+                                               OVER ({patient} ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW),
+                                           FIRST_VALUE(CASE WHEN admit THEN {time} END IGNORE NULLS)
+                                               OVER ({patient} ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING)) AS imputed_admission
+                                       FROM admits)'''.format(time = time, patient = patient)]
+
+            if self.baseline_creat in columns:
+                baseline = 'a.{}'.format(quote(self.baseline_creat))
+            else:
+                baseline = 'b.hb'
+                if self.eGFR_impute:
+                    female = 'a.{}::BOOLEAN'.format(quote(self.sex))
+                    if self.sex in ('male', 'MALE'):
+                        female = 'NOT ' + female
+                    female = '({})::DOUBLE'.format(female)
+                    creat_over_kappa = '(75/(142*(1 + 0.012*{})*POW(0.9938, a.{}::DOUBLE)))'.format(female, quote(self.age))
+                    kappa = '(0.9 - 0.2*{})'.format(female)
+                    alpha = '(-0.302 + 0.061*{})'.format(female)
+                    baseline = '''COALESCE(b.hb, CASE WHEN {cok} < 1 THEN {kappa}*POW({cok}, -1/1.200)
+                                                      ELSE {kappa}*POW({cok}, 1/{alpha}) END)'''.format(
+                                    cok = creat_over_kappa, kappa = kappa, alpha = alpha)
+            ctes.append('''baselines AS (SELECT a.*, {baseline} AS baseline FROM admissions a
+                                         LEFT JOIN (SELECT {pid}, {time}, hb FROM admits WHERE admit) b
+                                         ON a.{pid} = b.{pid} AND a.imputed_admission = b.{time})'''.format(
+                                            baseline = baseline, pid = pid, time = time))
+
+            within = lambda ns: 'COALESCE({t} BETWEEN imputed_admission AND imputed_admission + INTERVAL ({us}) MICROSECONDS, FALSE)'.format(
+                                    t = time, us = ns // 1000)
+            stage1 = '{} >= {} OR {} >= {}'.format(r4(creat), r4('0.3 + baseline'), r4(creat), r4('1.5*baseline'))
+            aki = 'CASE WHEN {} AND baseline IS NOT NULL THEN {} ELSE {} END'.format(within(self._cond2ns), stage('baseline', stage1),
+                                                                                   stage('min2', cond2))
+            # Outside the first 48 hours of an admission (or without a baseline), the 48-hour rolling minimum can still give stage 1
+            aki = 'CASE WHEN ({aki}) = 0 AND (NOT {mask} OR baseline IS NULL) THEN ({c1} OR {c2})::INT ELSE {aki} END'.format(
+                    aki = aki, mask = within(self._cond1ns), c1 = cond1, c2 = cond2)
+
+            if self.add_admission_col:
+                extra.append('imputed_admission')
+            if self.add_imputed_encounter:
+                extra.append('''CASE WHEN imputed_admission IS NOT NULL
+                                     THEN DENSE_RANK() OVER (ORDER BY imputed_admission, {}) - 1 END AS imputed_encounter_id'''.format(pid))
+            if self.add_baseline_creat and self.baseline_creat not in columns:
+                extra.append('baseline AS {}'.format(quote(self.baseline_creat)))
+            source = 'baselines'
+        else:
+            aki = stage('min2', '{} OR {}'.format(cond1, cond2))
+            source = 'rolling'
+
+        select = [pid, time] + [quote(col) for col in columns if col not in (self.patient_id, self.time)] + extra + ['{} AS aki'.format(aki)]
+        query = 'WITH {} SELECT {} FROM {} ORDER BY {}, {}'.format(',\n'.join(ctes), ', '.join(select), source, pid, time)
+        return con.sql(query)
+
+    def alignOutcomes(self, flagged, outcomes, windows, event = 'event', min_stage = 1):
+        '''
+        Labels every patient with the outcomes that follow their AKI episode, e.g. death or dialysis within 30 days of the first AKI.
+        Each patient's anchor is the time of their first flag at or above min_stage (or, for patients never flagged, their first
+        measurement, so they can serve as controls). For every outcome event type, the first event at or after the anchor is found
+        with a sorted as-of join on (patient, time), vectorized over all the patients at once. Every window label is then a
+        comparison of that event's delay against the window.
+
+        Args:
+            flagged (pd.DataFrame): Output of :meth:`returnAKIpatients` (or any dataframe with patient id, time and AKI columns).
+            outcomes (pd.DataFrame): Outcome events in long format: patient id, time and event type (e.g. 'death', 'dialysis').
+            windows (dict): Maps the name of each label to an (event type, window) pair; e.g. {'dialysis30d': ('dialysis', '30days')}.
+                A window of None labels whether the event happens at all after the anchor.
+            event (string): **default 'event'.** Name of the column containing the event types in the outcomes.
+            min_stage (int): **default 1.** Lowest AKI stage that counts as an episode.
+        Returns:
+            df (pd.DataFrame): One row per patient (indexed by patient id) with their highest AKI stage, the anchor time, the time
+            of the first event of every type used after the anchor (NaT if none) and a boolean column per label.
+        '''
+        flagged = flagged.reset_index() if self.patient_id in flagged.index.names else flagged
+        outcomes = outcomes.reset_index() if self.patient_id in outcomes.index.names else outcomes
+
+        # Anchors: first row with AKI >= min_stage, else the first row of the patient
+        codes, patients = pd.factorize(flagged[self.patient_id])
+        times = flagged[self.time].values.astype('datetime64[ns]').view('int64')
+        stages = flagged['aki'].values
+        episode = stages >= min_stage
+        order = np.lexsort((times, ~episode, codes)) # Per patient: episode rows first, then by time
+        first = order[np.r_[True, codes[order][1:] != codes[order][:-1]]]
+        anchor = times[first]
+        highest = np.zeros(len(patients), dtype = 'int64')
+        np.maximum.at(highest, codes, stages)
+        result = pd.DataFrame({'aki': highest, 'anchor': anchor.view('datetime64[ns]')}, index = pd.Index(patients, name = self.patient_id))
+
+        # As-of join of every event type onto the anchors: the first event at or after the anchor, per patient
+        ecodes = pd.Index(patients).get_indexer(outcomes[self.patient_id])
+        known = ecodes >= 0 # Events of patients without flagged rows are ignored
+        ecodes, etimes = ecodes[known], outcomes[self.time].values.astype('datetime64[ns]').view('int64')[known]
+        etypes = outcomes[event].values[known]
+        qcodes = np.arange(len(patients))
+        delays = {}
+        for name in pd.unique(np.array([ev for ev, _ in windows.values()], dtype = 'object')):
+            mine = etypes == name
+            eorder = np.lexsort((etimes[mine], ecodes[mine]))
+            c, t = ecodes[mine][eorder], etimes[mine][eorder]
+            idx = np.minimum(_segmentedSearchsorted(c, t, qcodes, anchor, side = 'left'), len(t) - 1)
+            found = (c[idx] == qcodes) & (t[idx] >= anchor) if len(t) else np.zeros(len(qcodes), dtype = 'bool')
+            next_event = np.where(found, t[idx] if len(t) else 0, np.iinfo('int64').min)
+            result['{}_time'.format(name)] = next_event.view('datetime64[ns]') # int64 min is NaT
+            delays[name] = np.where(found, next_event - anchor, -1)
+
+        for label, (name, window) in windows.items():
+            delay = delays[name]
+            result[label] = (delay >= 0) if window is None else (delay >= 0) & (delay <= _toNanoseconds(window))
+        return result
+
+    def returnAKIepisodes(self, flagged, recovery = 0.25, akd_start = '7days', akd_end = '90days'):
+        '''
+        Tracks renal recovery and `acute kidney disease <https://kdigo.org/conference/acute-kidney-diseases-and-renal-recovery/>`_ (AKD)
+        after every AKI episode. An episode starts at a flagged row (and any flags before its recovery belong to it). Its reference
+        is the creatinine the onset was measured against, and it recovers at the first later measurement within `recovery` of that
+        reference. The recovery is found with a forward search over a sparse table of windowed minima of the patient-sorted
+        creatinine, so this is O(n log n) in total rather than a re-run of the flagger with a long window.
+
+        The status of each episode is then 'recovered' (within akd_start of onset), 'AKD' (recovered by akd_end, or not recovered
+        yet with follow-up past akd_start), 'persistent' (not recovered by akd_end; i.e. progression towards CKD) or 'censored' (not
+        recovered, with no follow-up past akd_start).
+
+        Args:
+            flagged (pd.DataFrame): Output of :meth:`returnAKIpatients`. If it has the reference columns (add_reference), the
+                reference of each onset is taken from them (so a trumping historical baseline is used); otherwise it is the
+                cond2time rolling minimum.
+            recovery (float): **default 0.25.** Recovery is a creatinine at most (1 + recovery) times the reference.
+            akd_start (string): **default '7days'.** Time after onset from which an unrecovered episode is AKD.
+            akd_end (string): **default '90days'.** Time after onset at which unrecovered AKD becomes persistent.
+        Returns:
+            df (pd.DataFrame): One row per episode, with the patient id, onset time, highest stage before recovery, reference
+            creatinine, recovery time (NaT if none), time to recovery and status.
+        '''
+        flagged = flagged.reset_index() if self.patient_id in flagged.index.names else flagged
+        codes, patients = pd.factorize(flagged[self.patient_id])
+        times = flagged[self.time].values.astype('datetime64[ns]').view('int64')
+        order = np.lexsort((times, codes))
+        codes, times = codes[order], times[order]
+        creat = flagged[self.creatinine].values.astype('float')[order]
+        aki = flagged['aki'].values[order]
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True]) if len(codes) else np.zeros(1, dtype = 'int64')
+        stops = np.repeat(bounds[1:], np.diff(bounds)) # End of each row's patient
+
+        if 'reference_creat' in flagged.columns:
+            reference = flagged['reference_creat'].values.astype('float')[order]
+        else:
+            reference = _rollingMin(creat, _segmentedSearchsorted(codes, times, codes, times - self._cond2ns, side = 'right'))
+
+        # Recovery of every flagged row, were it an onset: the first later row within (1 + recovery) of its reference
+        onsets = np.flatnonzero(aki > 0)
+        threshold = np.round((1 + recovery)*reference[onsets], decimals=4)
+        recovered = _firstAtMost(np.round(creat, decimals=4), onsets + 1, stops[onsets], threshold)
+
+        # A flagged row starts an episode unless it's before the recovery of the previous episode of the patient. The next episode
+        # is the first flagged row from the recovery on; without recovery, that is the first flagged row of a later patient
+        following = np.searchsorted(onsets, recovered)
+        episodes, i = [], 0
+        while i < len(onsets):
+            episodes.append(i)
+            i = following[i]
+        episodes = np.array(episodes, dtype = 'int64')
+        start, end = onsets[episodes], recovered[episodes]
+        has_recovery = end < stops[start]
+
+        # Highest stage from onset until recovery (segments don't overlap, so one reduceat over start/end pairs does it)
+        edges = np.stack([start, end], axis = 1).ravel()
+        stage = np.maximum.reduceat(np.r_[aki, 0], edges)[::2] if len(edges) else np.zeros(0, dtype = 'int64')
+
+        delay = np.where(has_recovery, times[np.minimum(end, len(times) - 1)] - times[start], -1)
+        follow_up = times[stops[start] - 1] - times[start]
+        akd_start, akd_end = _toNanoseconds(akd_start), _toNanoseconds(akd_end)
+        status = np.select([has_recovery & (delay < akd_start), has_recovery & (delay <= akd_end), follow_up > akd_end, follow_up >= akd_start],
+                           ['recovered', 'AKD', 'persistent', 'AKD'], 'censored')
+
+        return pd.DataFrame({self.patient_id: patients.take(codes[start]),
+                             'onset': times[start].view('datetime64[ns]'),
+                             'stage': stage,
+                             'reference_creat': reference[start],
+                             'recovery': np.where(has_recovery, times[start] + delay, np.iinfo('int64').min).view('datetime64[ns]'),
+                             'time_to_recovery': np.where(has_recovery, delay, np.iinfo('int64').min).view('timedelta64[ns]'),
+                             'status': status})
+
+    def returnTrajectory(self, flagged, patient, num_points = 500):
+        '''
+        Returns one patient's creatinine trajectory from a flagged cohort, downsampled for plotting. Long histories (e.g. thousands
+        of labs of a dialysis-adjacent patient) are reduced to about num_points rows with the `Largest-Triangle-Three-Buckets
+        <https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf>`_ algorithm, which keeps the visual shape (peaks & troughs) of
+        the curve. The flagged AKI rows and the reference minima they were measured against are always kept, on top of that.
+
+        Args:
+            flagged (pd.DataFrame): Output of :meth:`returnAKIpatients`, indexed by patient id & time.
+            patient (object): Patient id.
+            num_points (int): **default 500.** Number of rows to downsample to, besides the AKI rows and reference minima.
+        Returns:
+            df (pd.DataFrame): The patient's rows kept, indexed by time; e.g. plot df.index against df[creatinine].
+        '''
+        if self.patient_id not in flagged.index.names:
+            flagged = flagged.set_index([self.patient_id, self.time])
+        rows = flagged.xs(patient, level = self.patient_id)
+        rows = rows.iloc[np.argsort(rows.index.values, kind = 'stable')]
+        if len(rows) <= num_points:
+            return rows
+        times = rows.index.values.astype('datetime64[ns]').view('int64')
+        creat = rows[self.creatinine].values.astype('float')
+        aki = np.flatnonzero(rows['aki'].values > 0)
+
+        # Reference minima: the tracked reference labs if there are any, else the argmin of the rolling windows of each AKI row
+        if 'reference_time' in rows.columns:
+            reference = rows['reference_time'].values.astype('datetime64[ns]')[aki]
+            reference = [np.flatnonzero(np.isin(times, reference[~np.isnat(reference)].view('int64')))]
+        else:
+            zeros = np.zeros(len(times), dtype = 'int64')
+            reference = [_rollingMin(creat, _segmentedSearchsorted(zeros, times, zeros, times - window, side = 'right'), return_index = True)[1][aki]
+                         for window in (self._cond1ns, self._cond2ns)]
+        keep = np.unique(np.concatenate([_lttb((times - times[0]).astype('float'), creat, num_points), aki] + reference))
+        return rows.iloc[keep]
+
+class AKICensus:
+    '''
+    Interval index over flagger output, for point-in-time and range queries such as "who is in AKI stage >= 2 right now?". Each
+    patient's flags are turned into intervals of constant stage: an interval starts at the first row of a run of equally-staged
+    rows and lasts until the next row with a different stage (or, for the patient's latest run, is open-ended). Rows with AKI
+    stage 0 only end intervals. The intervals are kept in a centered interval tree of sorted numpy arrays, so a query visits
+    O(log n) nodes and costs O(log n + k) for k matches instead of a scan over all rows.
+
+    New flags are added with :meth:`update`. They go to a small unindexed buffer that is scanned linearly, and the tree is rebuilt
+    once the buffer outgrows an eighth of the index, so updates cost amortized O(log n) per interval.
+
+    Attributes:
+        flagged (pd.DataFrame): Output of :meth:`AKIFlagger.returnAKIpatients` (or any dataframe with patient id, time & AKI columns).
+        columns (list): **default None.** Extra columns carried into the intervals; e.g. ['ward']. A change in any of them also
+            starts a new interval, so the census can be broken down by them.
+        patient_id (string): **default 'patient_id'.** Name of the patient id column.
+        time (string): **default 'time'.** Name of the time column.
+        leaf_size (int): **default 64.** Largest node of the tree that is scanned instead of split further.
+    '''
+    OPEN = np.iinfo('int64').max # End of the intervals still ongoing
+
+    def __init__(self, flagged, columns = None, patient_id = 'patient_id', time = 'time', leaf_size = 64):
+        self.columns = list(columns) if columns is not None else []
+        self.patient_id = patient_id
+        self.time = time
+        self.leaf_size = leaf_size
+
+        # Interval arrays, grown by doubling; ids [0, _built) are in the tree and [_built, _size) in the buffer
+        self._arrays = None
+        self._size, self._built = 0, 0
+        self._last = {} # Latest interval of each patient; earlier ones are chained through _arrays['previous']
+        self._nodes, self._indexed_end = [], np.zeros(0, dtype = 'int64')
+        self.update(flagged)
+        self._rebuild()
+
+    def __len__(self):
+        return int((self._arrays['stage'][:self._size] > 0).sum()) if self._size else 0
+
+    def at(self, time, min_stage = 1):
+        '''
+        Returns the intervals at or above min_stage that are in effect at the given time; i.e. the patients in AKI at that time.
+
+        Args:
+            time (pd.Timestamp): Point in time; e.g. pd.Timestamp.now().
+            min_stage (int): **default 1.** Lowest AKI stage to return.
+        Returns:
+            df (pd.DataFrame): One row per matching interval, with the patient id, stage, start, end (NaT if ongoing) and the extra
+            columns. A patient has at most one interval in effect at a time.
+        '''
+        time = pd.Timestamp(time).value
+        return self._query(time, time + 1, min_stage)
+
+    def overlapping(self, start, end, min_stage = 1):
+        '''
+        Returns the intervals at or above min_stage that overlap the time range [start, end); e.g. everyone in AKI during a shift.
+
+        Args:
+            start (pd.Timestamp): Start of the range (inclusive).
+            end (pd.Timestamp): End of the range (exclusive).
+            min_stage (int): **default 1.** Lowest AKI stage to return.
+        Returns:
+            df (pd.DataFrame): One row per matching interval, as for :meth:`at`. A patient can have several.
+        '''
+        return self._query(pd.Timestamp(start).value, pd.Timestamp(end).value, min_stage)
+
+    def update(self, flagged):
+        '''
+        Adds newly flagged rows to the census. For every patient in them, the flags from their earliest row on replace what the
+        census had; the intervals before that are kept (and the one running at that time is cut off there). Pass all re-flagged rows
+        of the patients; e.g. the rows of :meth:`AKIFlagger.returnAKIpatientsIncremental` from 72 hours before the earliest new
+        time stamp on, since HB trumping can change flags that far back.
+
+        Args:
+            flagged (pd.DataFrame): Flagged rows, with the same columns as the flagger output the census was built from.
+        '''
+        new, patients, first = self._intervals(flagged)
+        arrays = self._arrays
+        start, end, stage = new['start'], new['end'], new['stage']
+
+        # Drop the intervals from each patient's earliest new row on, and cut off the one running at that time
+        for patient, since in zip(patients, first):
+            i = self._last.get(patient, -1)
+            while i >= 0 and arrays['end'][i] > since:
+                if arrays['start'][i] >= since:
+                    arrays['stage'][i] = 0 # Stage 0 marks the interval as dropped
+                    i = arrays['previous'][i]
+                else:
+                    arrays['end'][i] = since
+                    break
+            self._last[patient] = i
+
+        # The first new interval of a patient continues the one cut off at its start if nothing else changed (and, if that one is
+        # in the tree, it isn't extended past the end the tree was built with)
+        keep = np.ones(len(start), dtype = 'bool')
+        firsts = np.flatnonzero(np.r_[True, new['patient'][1:] != new['patient'][:-1]]) if len(start) else np.zeros(0, dtype = 'int64')
+        for j in firsts:
+            i = self._last[new['patient'][j]]
+            if i >= 0 and (i >= self._built or end[j] <= self._indexed_end[i]) and arrays['end'][i] == start[j] and \
+                    arrays['stage'][i] == stage[j] and all(arrays[col][i] == new[col][j] for col in self.columns):
+                arrays['end'][i] = end[j]
+                keep[j] = False
+        new = {name: values[keep] for name, values in new.items()}
+
+        # Chain the new intervals onto each patient's earlier ones
+        ids = self._size + np.arange(len(new['start']), dtype = 'int64')
+        new['previous'] = ids - 1
+        for j in (np.flatnonzero(np.r_[True, new['patient'][1:] != new['patient'][:-1]]) if len(ids) else []):
+            new['previous'][j] = self._last[new['patient'][j]]
+        for j in (np.flatnonzero(np.r_[new['patient'][1:] != new['patient'][:-1], True]) if len(ids) else []):
+            self._last[new['patient'][j]] = ids[j]
+        self._append(new)
+        if self._size - self._built > max(self.leaf_size, self._built // 8):
+            self._rebuild()
+
+    def _intervals(self, flagged):
+        '''
+        Helper function for :meth:`update`; splits flagged rows into intervals of constant stage (and extra columns). Returns the
+        interval arrays sorted by patient & start, and each patient with their earliest time stamp.
+        '''
+        df = flagged.reset_index() if self.patient_id in flagged.index.names else flagged
+        codes, patients = pd.factorize(df[self.patient_id])
+        times = df[self.time].values.astype('datetime64[ns]').view('int64')
+        order = np.lexsort((times, codes))
+        codes, times = codes[order], times[order]
+        stage = df['aki'].values.astype('int64')[order]
+        extra = {col: np.asarray(df[col].values)[order] for col in self.columns}
+
+        change = np.r_[True, codes[1:] != codes[:-1]][:len(codes)]
+        first = times[change]
+        for values in [stage] + list(extra.values()):
+            change[1:] |= values[1:] != values[:-1]
+        runs = np.flatnonzero(change)
+        last_run = np.r_[codes[runs][1:] != codes[runs][:-1], True] # Latest run of the patient
+        end = np.where(last_run, self.OPEN, times[np.r_[runs[1:], 0]] if len(runs) else runs)
+
+        runs, end = runs[stage[runs] > 0], end[stage[runs] > 0]
+        new = {'patient': np.asarray(patients.take(codes[runs]), dtype = 'object'), 'stage': stage[runs], 'start': times[runs], 'end': end}
+        new.update({col: values[runs] for col, values in extra.items()})
+        return new, list(patients), first
+
+    def _append(self, new):
+        '''
+        Helper function for :meth:`update`; appends intervals to the arrays, doubling their capacity as needed.
+        '''
+        size = self._size + len(new['start'])
+        if self._arrays is None:
+            self._arrays = {name: values[:0].copy() for name, values in new.items()}
+        for name, values in self._arrays.items():
+            dtype = 'object' if 'object' in (values.dtype, new[name].dtype) else np.result_type(values, new[name])
+            if size > len(values) or dtype != values.dtype: # e.g. longer strings in an extra column
+                grown = np.empty(max(size, 2*len(values)), dtype = dtype)
+                grown[:self._size] = values[:self._size]
+                self._arrays[name] = grown
+        for name, values in new.items():
+            self._arrays[name][self._size:size] = values
+        self._size = size
+
+    def _rebuild(self):
+        '''
+        Helper function for :meth:`update`; drops the dropped intervals and rebuilds the tree over all of them. Every node keeps the
+        intervals containing its center (the median start of its intervals) sorted by start and by end, with the intervals entirely
+        before and after the center in its left & right children. Since the center is one of the starts, every node keeps at least
+        one interval, and neither child gets more than half of them.
+        '''
+        live = self._arrays['stage'][:self._size] > 0
+        ids = np.cumsum(live) - 1
+        self._arrays = {name: values[:self._size][live] for name, values in self._arrays.items()}
+        previous = self._arrays['previous']
+        self._arrays['previous'] = np.where(previous >= 0, ids[previous], -1)
+        self._last = {patient: (ids[i] if i >= 0 else -1) for patient, i in self._last.items()}
+        self._size = self._built = int(live.sum())
+
+        start, end = self._arrays['start'], self._arrays['end']
+        self._indexed_end = end[:self._size].copy()
+        self._nodes = []
+        def build(ids):
+            node = len(self._nodes)
+            if len(ids) <= self.leaf_size:
+                self._nodes.append((None, ids))
+                return node
+            s, e = start[ids], end[ids]
+            center = np.partition(s, len(s)//2)[len(s)//2]
+            here = ids[(s <= center) & (e > center)]
+            by_start, by_end = here[np.argsort(start[here], kind = 'stable')], here[np.argsort(end[here], kind = 'stable')]
+            self._nodes.append([center, by_start, start[by_start], by_end, end[by_end], -1, -1])
+            self._nodes[node][5] = build(ids[e <= center]) if (e <= center).any() else -1
+            self._nodes[node][6] = build(ids[s > center]) if (s > center).any() else -1
+            return node
+        if self._size:
+            build(np.arange(self._size, dtype = 'int64'))
+
+    def _query(self, lo, hi, min_stage):
+        '''
+        Helper function for :meth:`at` & :meth:`overlapping`; returns the intervals overlapping [lo, hi) in nanoseconds. The ends
+        of intervals in the tree can only have been cut off since it was built, so the tree returns a superset that gets filtered on
+        the current ends (and on the buffer).
+        '''
+        found, stack = [np.arange(self._built, self._size, dtype = 'int64')], [0] if self._nodes else []
+        while stack:
+            node = self._nodes[stack.pop()]
+            if node[0] is None:
+                found.append(node[1])
+                continue
+            center, by_start, starts, by_end, ends, left, right = node
+            if hi <= center: # Only intervals starting before hi, and nothing to the right
+                found.append(by_start[:np.searchsorted(starts, hi, side = 'left')])
+                stack += [left] if left >= 0 else []
+            elif lo > center: # Only intervals ending after lo, and nothing to the left
+                found.append(by_end[np.searchsorted(ends, lo, side = 'right'):])
+                stack += [right] if right >= 0 else []
+            else:
+                found.append(by_start)
+                stack += [child for child in (left, right) if child >= 0]
+
+        arrays = self._arrays
+        ids = np.sort(np.concatenate(found))
+        ids = ids[(arrays['stage'][ids] >= max(min_stage, 1)) & (arrays['start'][ids] < hi) & (arrays['end'][ids] > lo)]
+        end = arrays['end'][ids]
+        result = pd.DataFrame({self.patient_id: arrays['patient'][ids], 'stage': arrays['stage'][ids],
+                               'start': arrays['start'][ids].view('datetime64[ns]'),
+                               'end': np.where(end == self.OPEN, np.iinfo('int64').min, end).view('datetime64[ns]')})
+        for col in self.columns:
+            result[col] = arrays[col][ids]
+        return result.sort_values(['start', self.patient_id], kind = 'stable').reset_index(drop = True)
+
+class AKICube:
+    '''
+    Pre-aggregated AKI incidence for dashboards & reports, so they don't re-aggregate row-level flagger output on every load. The
+    cube has one row per day x inpatient status x definition x stage (0-3), with three counts:
+
+        * *patients:* Patients whose highest stage that day (in that setting) is the stage; stage 0 counts the patients measured
+          without AKI, so the counts per day add up to the patients measured.
+        * *episodes:* Episodes starting that day at the stage; i.e. flagged rows whose previous row of the patient wasn't flagged.
+        * *measurements:* Rows (creatinine measurements) at the stage.
+
+    It is a few thousand rows for years of data, and is stored as a Parquet file sorted by definition & day, so a dashboard can
+    read it (or a filtered range of it) in milliseconds. New data replaces whole days with :meth:`update`, so the cube stays up
+    to date without re-aggregating the history.
+
+    Attributes:
+        flagged (pd.DataFrame): **default None.** Flagger output to aggregate; the cube is empty if None.
+        definitions (list): **default None.** AKI stage columns to aggregate, each a definition in the cube; e.g. the columns of
+            :meth:`AKIFlagger.returnAKIdefinitions`, or flagger outputs of different settings joined side by side. ['aki'] if None.
+        patient_id (string): **default 'patient_id'.** Name of the patient id column.
+        time (string): **default 'time'.** Name of the time column.
+        inpatient (string): **default 'inpatient'.** Name of the inpatient/outpatient column.
+    '''
+    def __init__(self, flagged = None, definitions = None, patient_id = 'patient_id', time = 'time', inpatient = 'inpatient'):
+        self.definitions = list(definitions) if definitions is not None else ['aki']
+        self.patient_id = patient_id
+        self.time = time
+        self.inpatient = inpatient
+        self.data = pd.DataFrame({'definition': pd.Series([], dtype = 'object'), 'day': pd.Series([], dtype = 'datetime64[ns]'),
+                                  self.inpatient: pd.Series([], dtype = 'bool'), 'stage': pd.Series([], dtype = 'int8'),
+                                  'patients': pd.Series([], dtype = 'int64'), 'episodes': pd.Series([], dtype = 'int64'),
+                                  'measurements': pd.Series([], dtype = 'int64')})
+        if flagged is not None:
+            self.update(flagged)
+
+    def update(self, flagged, since = None):
+        '''
+        Replaces the days from `since` on with the aggregates of the flagged rows. The rows must cover those days in full (all the
+        patients); rows before `since` are only used to tell whether an episode continues from the day before. For a daily update,
+        pass e.g. the re-flagged rows of :meth:`AKIFlagger.returnAKIpatientsIncremental` from a day before `since` on, with `since`
+        72 hours before the earliest new time stamp (as HB trumping can change flags that far back).
+
+        Args:
+            flagged (pd.DataFrame): Flagged rows, with the definition columns.
+            since (datetime-like): **default None.** First day to replace (rounded down to midnight); the first day of the rows if None.
+        Returns:
+            data (pd.DataFrame): The updated cube.
+        '''
+        df = flagged.reset_index() if self.patient_id in flagged.index.names else flagged
+        codes = pd.factorize(df[self.patient_id])[0]
+        times = df[self.time].values.astype('datetime64[ns]').view('int64')
+        order = np.lexsort((times, codes))
+        codes, times = codes[order], times[order]
+        days = times - times % (86400*10**9)
+        if since is not None:
+            since = pd.Timestamp(since).floor('D').value
+        elif len(days):
+            since = days.min()
+        else:
+            return self.data
+
+        counted = days >= since
+        new_patient = np.r_[True, codes[1:] != codes[:-1]][:len(codes)]
+        key = pd.DataFrame({'code': codes, 'day': days.view('datetime64[ns]'), self.inpatient: df[self.inpatient].values.astype('bool')[order]})[counted]
+        cubes = []
+        for name in self.definitions:
+            stage = df[name].values.astype('int8')[order]
+            onset = (stage > 0) & (new_patient | (np.r_[0, stage[:-1]][:len(stage)] == 0))
+            rows = key.assign(stage = stage[counted], onset = onset[counted])
+            daily = rows.groupby(['code', 'day', self.inpatient], sort = False)['stage'].max().reset_index() # Highest stage per patient-day
+            groups = ['day', self.inpatient, 'stage']
+            cube = pd.concat([daily.groupby(groups).size().rename('patients'),
+                              rows.groupby(groups)['onset'].sum().rename('episodes'),
+                              rows.groupby(groups).size().rename('measurements')], axis = 1).fillna(0).astype('int64').reset_index()
+            cubes.append(cube.assign(definition = name))
+
+        kept = self.data[self.data['day'].values.astype('datetime64[ns]').view('int64') < since]
+        data = pd.concat([kept] + [cube.loc[:, kept.columns] for cube in cubes], ignore_index = True)
+        data['stage'] = data['stage'].astype('int8')
+        self.data = data.sort_values(['definition', 'day', self.inpatient, 'stage'], kind = 'stable').reset_index(drop = True)
+        return self.data
+
+    def save(self, path):
+        '''
+        Writes the cube to a Parquet file (replaced atomically); requires pyarrow.
+
+        Args:
+            path (str): File to write the cube to.
+        '''
+        self.data.to_parquet(path + '.tmp', index = False)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        '''
+        Reads a cube written by :meth:`save`, e.g. to update it with the next day's flags.
+
+        Args:
+            path (str): Parquet file of the cube.
+            **kwargs: Column names & definitions, as for the constructor.
+        Returns:
+            cube (AKICube): The cube.
+        '''
+        cube = cls(**kwargs)
+        cube.data = pd.read_parquet(path)
+        return cube
+
+# Array kernels used by the 'numpy' and 'numba' engines. All of them expect patient-contiguous arrays sorted by time within each
+# patient; `bounds` holds the start index of every patient followed by the total length, and times are int64 nanoseconds.
+
+ADMISSION_GAP = 72*3600*10**9   # Two inpatient measurements at most 72 hours apart make an admission
+BASELINE_START = 365*86400*10**9 # Baseline window runs from 365 days ...
+BASELINE_END = 7*86400*10**9     # ... to 7 days prior to admission
+MINUTE = 60*10**9
+
+def _compactTimes(times):
+    '''
+    Returns (times, unit): int32 minutes (unit = MINUTE) if every time stamp is a whole minute (as lab draws usually are), else the
+    int64 nanoseconds (unit = 1). Halves the memory of the times and of everything the kernels derive from them; the range check
+    leaves room for the windows to be subtracted without overflow (i.e. the years ~0 to ~3900).
+    '''
+    if len(times) and not np.any(times % MINUTE) and np.abs(times // MINUTE).max() < 2**30:
+        return (times // MINUTE).astype('int32'), MINUTE
+    return times, 1
+
+DUPLICATE_POLICIES = ('first', 'last', 'max', 'mean')
+_SQL_INPUTS = itertools.count() # Numbers the views returnAKIpatientsSQL registers, s.t. earlier (lazy) results keep their input
+
+def _duplicateRows(codes, times, creat, how = 'first'):
+    '''
+    Reduces the rows duplicated on (patient, time) in one segmented pass over the sorted arrays (stable, so 'first' & 'last' are
+    in the input order). Returns the positions of the rows kept, one per (patient, time), and their creatinine values; for 'mean'
+    the first row is kept with the mean creatinine.
+    '''
+    creat = np.asarray(creat, dtype = 'float')
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (times[1:] != times[:-1])][:len(codes)])
+    if how == 'first' or len(starts) == len(codes): # Nothing to reduce
+        return starts, creat[starts]
+    counts = np.diff(np.r_[starts, len(codes)])
+    if how == 'last':
+        rows = starts + counts - 1
+    elif how == 'max': # First row attaining the maximum of its segment
+        highest = np.repeat(np.maximum.reduceat(creat, starts), counts)
+        rows = np.minimum.reduceat(np.where(creat == highest, np.arange(len(creat)), len(creat)), starts)
+    else:
+        return starts, np.add.reduceat(creat, starts) / counts
+    return rows, creat[rows]
+
+def _segmentedSearchsorted(codes, times, qcodes, qtimes, side = 'left'):
+    '''
+    Equivalent of np.searchsorted over rows sorted by (patient code, time): returns, for every query (qcode, qtime), the index at which
+    it would be inserted. Implemented as a single lexsort-merge of the rows & queries, so no per-patient loop is needed.
+    '''
+    n = len(codes)
+    data_first = side == 'right' # On ties, rows sort before queries for side='right' (i.e. rows <= query are counted)
+    flag = np.r_[np.full(n, not data_first), np.full(len(qcodes), data_first)]
+    order = np.lexsort((flag, np.r_[times, qtimes], np.r_[codes, qcodes]))
+    is_row = order < n
+    before = np.cumsum(is_row) - is_row # Number of rows strictly before each merged position
+    result = np.empty(len(qcodes), dtype = 'int64')
+    result[order[~is_row] - n] = before[~is_row]
+    return result
+
+def _rollingMin(values, starts, return_index = False):
+    '''
+    Minimum of values[starts[i]:i+1] for every i, using a sparse table with only as many levels as the longest window needs. With
+    return_index, the table holds row indices instead and (minimum, argmin) is returned; ties go to the latest row.
+    '''
+    n = len(values)
+    stops = np.arange(n)
+    if n == 0:
+        return (values.astype('float'), stops) if return_index else values.astype('float')
+    k = np.frexp((stops - starts + 1).astype('float'))[1] - 1 # floor(log2(window length))
+    if return_index:
+        table = np.empty((k.max() + 1, n), dtype = 'int64')
+        table[0] = stops
+        for level in range(1, k.max() + 1):
+            step = 1 << (level - 1)
+            left, right = table[level - 1, :n - step], table[level - 1, step:]
+            table[level] = table[level - 1]
+            table[level, :n - step] = np.where(values[right] <= values[left], right, left)
+        left, right = table[k, starts], table[k, stops - (1 << k) + 1]
+        index = np.where(values[right] <= values[left], right, left)
+        return values[index], index
+    table = np.empty((k.max() + 1, n))
+    table[0] = values
+    for level in range(1, k.max() + 1):
+        step = 1 << (level - 1)
+        table[level] = table[level - 1]
+        table[level, :n - step] = np.minimum(table[level - 1, :n - step], table[level - 1, step:])
+    return np.minimum(table[k, starts], table[k, stops - (1 << k) + 1])
+
+def _lttb(x, y, num_points):
+    '''
+    Largest-Triangle-Three-Buckets downsampling: returns the indices of num_points of the (x-sorted) points. The first and last
+    points are kept, and every bucket in between contributes the point forming the largest triangle with the previous point kept
+    and the mean of the next bucket.
+    '''
+    n = len(x)
+    if num_points >= n or num_points < 3:
+        return np.arange(n)
+    edges = (np.arange(num_points - 1)*((n - 2)/(num_points - 2))).astype('int64') + 1 # Buckets of the points between the first & last
+    edges[-1] = n - 1
+    counts = np.diff(np.r_[edges, n])
+    mean_x, mean_y = np.add.reduceat(x, edges)/counts, np.add.reduceat(y, edges)/counts # Next bucket means (the last is the last point)
+    kept = np.empty(num_points, dtype = 'int64')
+    kept[0], kept[-1] = 0, n - 1
+    for i in range(num_points - 2):
+        lo, hi, a = edges[i], edges[i + 1], kept[i]
+        area = np.abs((x[a] - mean_x[i + 1])*(y[lo:hi] - y[a]) - (x[a] - x[lo:hi])*(mean_y[i + 1] - y[a]))
+        kept[i + 1] = lo + np.argmax(area)
+    return kept
+
+def _firstAtMost(values, starts, stops, thresholds):
+    '''
+    For every query i, the first index j in [starts[i], stops[i]) with values[j] <= thresholds[i], or stops[i] if there is none.
+    A sparse table of forward minima (values[j:j + 2**k]) is searched by binary lifting, i.e. O(log n) vectorized steps per query.
+    '''
+    n = len(values)
+    position = np.asarray(starts, dtype = 'int64').copy()
+    if n == 0 or len(position) == 0:
+        return position
+    levels = int(np.log2(max(n, 1))) + 1
+    table = [values]
+    for level in range(1, levels):
+        step = 1 << (level - 1)
+        table.append(np.r_[np.minimum(table[-1][:n - step], table[-1][step:]) if n > step else [], np.full(min(step, n), np.inf)])
+    for level in range(levels - 1, -1, -1): # Jump over every block of 2**level values that are all above the threshold
+        size = 1 << level
+        jump = (position + size <= stops) & (table[level][np.minimum(position, n - 1)] > thresholds)
+        position[jump] += size
+    return position
+
+def _numpyAdmissions(bounds, times, inpatient, unit = 1):
+    '''
+    Vectorized admission imputation; returns (admit, admit_mask), i.e. the row index of each row's admission (-1 if the patient
+    has none) and which rows are admissions. Times are in units of `unit` nanoseconds.
+    '''
+    n = len(times)
+    codes = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+
+    # Admission is the first of two consecutive inpatient measurements <= 72 hours apart (i.e. following a non-admission row)
+    same_next = np.r_[codes[1:] == codes[:-1], False]
+    cond1 = same_next & (np.r_[np.diff(times), 0] <= ADMISSION_GAP // unit)
+    cond2 = inpatient & np.r_[inpatient[1:], True]
+    c1c2 = cond1 & cond2
+    admit_mask = c1c2 & ~np.r_[False, c1c2[:-1] & same_next[:-1]]
+
+    # Forward- then back-fill the admission rows within each patient
+    idx = np.arange(n)
+    first, last = np.repeat(bounds[:-1], np.diff(bounds)), np.repeat(bounds[1:] - 1, np.diff(bounds))
+    ffill = np.maximum.accumulate(np.where(admit_mask, idx, -1))
+    bfill = np.minimum.accumulate(np.where(admit_mask, idx, n)[::-1])[::-1]
+    return np.where(ffill >= first, ffill, np.where(bfill <= last, bfill, -1)), admit_mask
+
+def _numpySweep(bounds, times, creat, inpatient, window1, window2, HB_trumping, compute_baseline, track_reference = False, unit = 1):
+    '''
+    Vectorized NumPy implementation of the per-patient sweep: rolling minima over (t - window, t], imputed admission rows and
+    baseline creatinine medians. Returns (min1, min2, admit, baseline, arg1, arg2), where admit is the row index of each row's
+    admission (-1 if none) and arg1/arg2 are the row indices of the rolling minima (None unless track_reference is set). Times
+    and windows are in units of `unit` nanoseconds.
+    '''
+    n = len(times)
+    codes = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+    min1 = _rollingMin(creat, _segmentedSearchsorted(codes, times, codes, times - window1, side = 'right'), track_reference)
+    min2 = _rollingMin(creat, _segmentedSearchsorted(codes, times, codes, times - window2, side = 'right'), track_reference)
+    (min1, arg1), (min2, arg2) = (min1, min2) if track_reference else ((min1, None), (min2, None))
+    admit = np.full(n, -1, dtype = 'int64')
+    baseline = np.full(n, np.nan)
+    if not HB_trumping or n == 0:
+        return min1, min2, admit, baseline, arg1, arg2
+
+    admit, admit_mask = _numpyAdmissions(bounds, times, inpatient, unit)
+
+    if compute_baseline: # Median of the outpatient values from 365 to 7 days prior to each admission
+        admissions = np.flatnonzero(admit_mask)
+        outpatient = ~inpatient
+        ocodes, otimes, ocreat = codes[outpatient], times[outpatient], creat[outpatient]
+        lo = _segmentedSearchsorted(ocodes, otimes, codes[admissions], times[admissions] - BASELINE_START // unit, side = 'left')
+        hi = _segmentedSearchsorted(ocodes, otimes, codes[admissions], times[admissions] - BASELINE_END // unit, side = 'right')
+        medians = np.full(len(admissions), np.nan)
+        for j in np.flatnonzero(hi > lo):
+            medians[j] = np.median(ocreat[lo[j]:hi[j]])
+        has_admit = admit >= 0
+        baseline[has_admit] = medians[np.searchsorted(admissions, admit[has_admit])]
+    return min1, min2, admit, baseline, arg1, arg2
+
+def _sweep(bounds, times, creat, inpatient, window1, window2, HB_trumping, compute_baseline, track_reference = False, unit = 1):
+    '''
+    Loop implementation of the per-patient sweep, written to be compiled by numba (see :func:`_numbaSweep`); same contract as
+    :func:`_numpySweep`. The rolling minima use monotonic deques, so the whole sweep is linear in the number of rows for the windows.
+    The row index of each minimum is the head of its deque, so arg1/arg2 are always filled in (at no extra cost).
+    '''
+    n = times.shape[0]
+    min1 = np.empty(n)
+    min2 = np.empty(n)
+    arg1 = np.empty(n, dtype = np.int64)
+    arg2 = np.empty(n, dtype = np.int64)
+    admit = np.full(n, -1, dtype = np.int64)
+    baseline = np.full(n, np.nan)
+    deque1 = np.empty(n, dtype = np.int64)
+    deque2 = np.empty(n, dtype = np.int64)
+    scratch = np.empty(n)
+
+    for p in range(bounds.shape[0] - 1):
+        lo, hi = bounds[p], bounds[p + 1]
+
+        # Rolling minima over (t - window, t]
+        head1, tail1, head2, tail2 = lo, lo, lo, lo
+        for i in range(lo, hi):
+            while tail1 > head1 and creat[deque1[tail1 - 1]] >= creat[i]:
+                tail1 -= 1
+            deque1[tail1] = i
+            tail1 += 1
+            while times[deque1[head1]] <= times[i] - window1:
+                head1 += 1
+            arg1[i] = deque1[head1]
+            min1[i] = creat[arg1[i]]
+
+            while tail2 > head2 and creat[deque2[tail2 - 1]] >= creat[i]:
+                tail2 -= 1
+            deque2[tail2] = i
+            tail2 += 1
+            while times[deque2[head2]] <= times[i] - window2:
+                head2 += 1
+            arg2[i] = deque2[head2]
+            min2[i] = creat[arg2[i]]
+
+        if not HB_trumping:
+            continue
+
+        # Admissions: forward-fill the admission rows, then back-fill the rows before the first admission
+        current, previous = -1, False
+        for i in range(lo, hi):
+            c1c2 = i + 1 < hi and inpatient[i] and inpatient[i + 1] and times[i + 1] - times[i] <= ADMISSION_GAP // unit
+            if c1c2 and not previous:
+                current = i
+            previous = c1c2
+            admit[i] = current
+        for i in range(lo, hi):
+            if admit[i] >= 0:
+                for j in range(lo, i):
+                    admit[j] = admit[i]
+                break
+
+        # Baselines: one median per admission, shared by all the rows assigned to it
+        if not compute_baseline:
+            continue
+        for i in range(lo, hi):
+            if admit[i] < 0 or (i > lo and admit[i] == admit[i - 1]):
+                continue
+            start, end = times[admit[i]] - BASELINE_START // unit, times[admit[i]] - BASELINE_END // unit
+            k = 0
+            for j in range(lo, hi):
+                if not inpatient[j] and start <= times[j] <= end:
+                    scratch[k] = creat[j]
+                    k += 1
+            median = np.median(scratch[:k]) if k > 0 else np.nan
+            j = i
+            while j < hi and admit[j] == admit[i]:
+                baseline[j] = median
+                j += 1
+    return min1, min2, admit, baseline, arg1, arg2
+
+_NUMBA_SWEEP = None
+
+def _numbaSweep():
+    '''
+    Returns the numba-compiled :func:`_sweep` (compiled on first use), or None if numba is not installed.
+    '''
+    global _NUMBA_SWEEP
+    if _NUMBA_SWEEP is None:
+        try:
+            import numba
+        except ImportError:
+            return None
+        _NUMBA_SWEEP = numba.njit(cache = True, nogil = True)(_sweep) # nogil, s.t. num_threads shards run in parallel
+    return _NUMBA_SWEEP
+
+REFERENCE_NONE, REFERENCE_MIN1, REFERENCE_MIN2, REFERENCE_BASELINE = 0, 1, 2, 3 # Which reference value a stage was measured against
+
+def _stageAKI(creat, min1, min2, baseline = None, mask2d = None, mask7d = None, return_reference = False):
+    '''
+    KDIGO staging on arrays; mirrors Step 3 of :meth:`AKIFlagger.returnAKIpatients`. Historical baseline "trumping" is applied when a
+    baseline is passed, in which case the admission masks (admission to +2 days and +7 days, respectively) are required.
+
+    With return_reference, (aki, reference) is returned, where reference says which value each stage > 0 was measured against: the
+    baseline (if it trumped), else the cond2time minimum if the 50% increase holds (stages 2 & 3 always do), else the cond1time minimum.
+    '''
+    creat = np.round(creat, decimals=4)
+    c1 = creat >= np.round(0.3 + min1, decimals=4)
+    c2 = creat >= np.round(1.5*min2, decimals=4)
+    stage2 = creat >= np.round(2*min2, decimals=4)
+    stage3 = creat >= np.round(3*min2, decimals=4)
+    if baseline is None: # Vanilla rolling minimum
+        aki = stage3.astype('int64') + stage2 + np.logical_or(c1, c2)
+        if return_reference:
+            return aki, np.where(aki == 0, REFERENCE_NONE, np.where(c2, REFERENCE_MIN2, REFERENCE_MIN1))
+        return aki
+
+    aki = stage3.astype('int64') + stage2 + c2 # Condition 1 is added in later so as not to have the HB double-trump
+    mask_bc = ~np.isnan(baseline)
+    mask = mask7d & mask_bc
+    stage1hb = np.logical_or(creat >= np.round(0.3 + baseline, decimals=4), creat >= np.round(1.5*baseline, decimals=4))
+    akihb = (creat >= np.round(3*baseline, decimals=4)).astype('int64') + (creat >= np.round(2*baseline, decimals=4)) + stage1hb
+    aki[mask] = akihb[mask]
+
+    mask_rw = (aki == 0) & (~mask2d | ~mask_bc) # Add back in the 0.3 bump criterion
+    aki[mask_rw] = np.logical_or(c1, c2)[mask_rw]
+    if return_reference:
+        reference = np.where(aki == 0, REFERENCE_NONE, np.where(c2, REFERENCE_MIN2, REFERENCE_MIN1))
+        reference[mask & (akihb > 0)] = REFERENCE_BASELINE
+        return aki, reference
+    return aki
+
+def _rollingReference(creat, starts, statistic):
+    '''
+    Reference statistic ('min', 'mean' or 'first'; see :class:`AKIRule`) of creat[starts[i]:i+1] for every i.
+    '''
+    if statistic == 'min':
+        return _rollingMin(creat, starts)
+    if statistic == 'first':
+        return creat[starts]
+    total = np.r_[0, np.cumsum(creat)]
+    end = np.arange(1, len(creat) + 1)
+    return (total[end] - total[starts]) / (end - starts)
+
+def _evaluateRules(creat, compiled):
+    '''
+    Stages of a compiled AKI definition, i.e. a list of (rule, reference) pairs; every row gets the highest stage whose rule it
+    meets. Uses the same rounding as :func:`_stageAKI`.
+    '''
+    stage = np.zeros(len(creat), dtype = 'int64')
+    rounded = np.round(creat, decimals=4)
+    for rule, reference in compiled:
+        threshold = rule.ratio*reference if rule.ratio is not None else rule.increase + reference
+        met = rounded >= np.round(threshold, decimals=4)
+        if rule.at_least is not None:
+            met &= rounded >= rule.at_least
+        stage = np.where(met, np.maximum(stage, rule.stage), stage)
+    return stage
+
+def bootstrap_metrics(y_true, y_pred, num_replicates = 1000, alpha = 0.05, threshold = 1, batch_size = 100, seed = None):
+    '''
+    Point estimates and bootstrap confidence intervals of the performance of one or more AKI definitions against an outcome;
+    e.g. on the per-patient output of :meth:`AKIFlagger.alignOutcomes`. The resamples are drawn as matrices of row indices (the
+    same ones for every definition, so the intervals are paired), and each batch of replicates is counted with a single
+    np.bincount over (replicate, prediction, outcome). Every metric of every replicate then follows from the counts, without
+    a loop over the replicates.
+
+    Args:
+        y_true (array-like): Boolean outcome of every patient (row).
+        y_pred (array-like or dict): AKI stages (or any ordinal score) of every patient; or a dict (or dataframe) of them, per definition.
+        num_replicates (int): **default 1000.** Number of bootstrap replicates.
+        alpha (float): **default 0.05.** The intervals are the alpha/2 and 1 - alpha/2 percentiles of the replicates.
+        threshold (int): **default 1.** Scores at or above the threshold count as positive for the confusion matrix. The AUC
+            uses the score itself, so with stages it rewards ranking stage 3 above stage 1.
+        batch_size (int): **default 100.** Number of replicates counted at a time; bounds the memory of the index matrices.
+        seed (int): **default None.** Seed of the random number generator, for reproducible intervals.
+
+    Returns:
+        df (pd.DataFrame): Indexed by (definition, metric), with the estimate and the lower & upper bounds. The metrics are
+        SENS, SPEC, PPV, NPV, F1 and AUC.
+    '''
+    if not isinstance(y_pred, dict) and not hasattr(y_pred, 'columns'):
+        y_pred = {'aki': y_pred}
+    y_true = np.asarray(y_true, dtype = 'bool')
+    n = len(y_true)
+    rng = np.random.default_rng(seed)
+    batches = (rng.integers(0, n, size = (min(batch_size, num_replicates - start), n)) for start in range(0, num_replicates, batch_size))
+
+    codes, positive, levels = {}, {}, {}
+    for name in y_pred:
+        scores, inverse = np.unique(np.asarray(y_pred[name]), return_inverse = True)
+        codes[name], positive[name], levels[name] = 2*inverse.ravel() + y_true, scores >= threshold, len(scores)
+
+    metrics = {name: [] for name in y_pred}
+    for idx in itertools.chain([np.arange(n)[None]], batches): # The first "batch" is the full sample, for the point estimates
+        offsets = np.arange(idx.shape[0])[:, None]
+        for name in y_pred:
+            width = 2*levels[name]
+            counts = np.bincount((codes[name][idx] + width*offsets).ravel(), minlength = width*idx.shape[0])
+            metrics[name].append(_bootstrapMetrics(counts.reshape(idx.shape[0], levels[name], 2), positive[name]))
+
+    rows = []
+    for name in y_pred:
+        estimate = metrics[name][0][:, 0]
+        replicates = np.concatenate(metrics[name][1:], axis = 1) if num_replicates > 0 else np.empty((len(_METRICS), 0))
+        with np.errstate(all = 'ignore'): # All-nan metrics (e.g. no positives) give nan bounds
+            lower, upper = np.nanpercentile(replicates, [100*alpha/2, 100*(1 - alpha/2)], axis = 1) if replicates.shape[1] else (np.nan, np.nan)
+        rows.append(pd.DataFrame({'estimate': estimate, 'lower': lower, 'upper': upper},
+                                 index = pd.MultiIndex.from_product([[name], _METRICS], names = ['definition', 'metric'])))
+    return pd.concat(rows)
+
+_METRICS = ['SENS', 'SPEC', 'PPV', 'NPV', 'F1', 'AUC']
+
+def _bootstrapMetrics(counts, positive):
+    '''
+    Metrics of every replicate from its counts of (score level, outcome), shaped (replicates, levels, 2). Returns an array shaped
+    (metrics, replicates); see :data:`_METRICS` for the order.
+    '''
+    neg, pos = counts[:, :, 0].astype('float'), counts[:, :, 1].astype('float')
+    TP, FN = pos[:, positive].sum(axis = 1), pos[:, ~positive].sum(axis = 1)
+    FP, TN = neg[:, positive].sum(axis = 1), neg[:, ~positive].sum(axis = 1)
+    below = np.cumsum(neg, axis = 1) - neg # Negatives with a lower score than each level
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        AUC = (pos*(below + 0.5*neg)).sum(axis = 1) / (pos.sum(axis = 1)*neg.sum(axis = 1)) # Mann-Whitney U, ties count half
+        return np.array([TP/(TP + FN), TN/(TN + FP), TP/(TP + FP), TN/(TN + FN), 2*TP/(2*TP + FP + FN), AUC])
+
+def generate_toy_data(num_patients = 100, num_encounters_range = (1, 3), num_time_range = (5,10), creat_scale = 0.3,
+                      include_demographic_info = False, date_range = None, time_delta_range = None, set_index = False, printMsg=True):
+        '''
+        Generates toy data for demonstrating how the flagger works.
+
+        Args:
+            num_patients (int): integer, default 100.
+                Number of patients to generate
+            num_encounters_range (tuple): tuple, default (3, 10).
+                Number of encounters per patient will be randomly selected from a range between this tuple.
+            include_demographic_info (bool): boolean, default False. 
+                Whether or not to include the demographic information in the generated dataset
+
+
+        Returns
+            df (pd.DataFrame): dataframe with toy numbers to work with.
+
+        '''
+        import random
+
         np.random.seed(0) # seed for reproducibility
 
         # To explicitly demonstrate that race and sex variables only care about black/female distinction
@@ -432,7 +2726,7 @@ def generate_toy_data(num_patients = 100, num_encounters_range = (1, 3), num_tim
         df[patient_id] = df[patient_id].astype('int')
         df[encounter_id] = df[encounter_id].astype('int')
         
-        df = df[~df.time.duplicated()]    
+        df = df[~df.duplicated([patient_id, time])] # Repeat draws of a patient at the same time
         df = df.groupby(patient_id, sort=False, as_index=False).apply(lambda d: d.sort_values(time))
         df = df.reset_index(drop=True)
 
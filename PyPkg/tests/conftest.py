@@ -0,0 +1,37 @@
+import os, random, sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import akiFlagger
+
+def toyCohort(num_patients = 60, seed = 0, demographics = False):
+    '''
+    Seeded toy cohort sorted by patient & time; with demographics, age is a float and female a boolean column.
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+    df = akiFlagger.generate_toy_data(num_patients = num_patients, printMsg = False, include_demographic_info = demographics)
+    if demographics:
+        df['age'], df['female'] = df['age'].astype('float'), df['female'].astype('bool')
+    return df.sort_values(['patient_id', 'time']).reset_index(drop = True)
+
+def withDuplicates(df, seed = 0):
+    '''
+    Appends repeat draws (same patient & time, different creatinine) of a fifth of the rows, and shuffles the result.
+    '''
+    rng = np.random.default_rng(seed)
+    repeats = df.sample(frac = 0.2, random_state = seed)
+    repeats = repeats.assign(creatinine = (repeats['creatinine']*rng.uniform(0.5, 2, len(repeats))).round(2))
+    return pd.concat([df, repeats]).sample(frac = 1, random_state = seed).reset_index(drop = True)
+
+@pytest.fixture
+def cohort():
+    return toyCohort
+
+@pytest.fixture
+def duplicated():
+    return withDuplicates
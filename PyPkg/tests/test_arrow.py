@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import akiFlagger
+
+pa = pytest.importorskip('pyarrow')
+
+def test_arrow_matches_pandas(cohort):
+    df = cohort(num_patients = 50)
+    expected = akiFlagger.AKIFlagger(engine = 'numpy').returnAKIpatients(df.copy())['aki'].values
+    result = akiFlagger.AKIFlagger().returnAKIpatientsArrow(pa.Table.from_pandas(df, preserve_index = False))
+    np.testing.assert_array_equal(result['aki'].to_numpy(), expected)
+
+def test_arrow_polars_string_ids(cohort):
+    pl = pytest.importorskip('polars')
+    df = cohort(num_patients = 50)
+    df['patient_id'] = 'MR' + df['patient_id'].astype('str')
+    expected = akiFlagger.AKIFlagger(engine = 'numpy').returnAKIpatients(df.copy())['aki'].values
+    result = akiFlagger.AKIFlagger().returnAKIpatientsArrow(pl.from_pandas(df)) # polars exports strings as string_view
+    np.testing.assert_array_equal(result['aki'].to_numpy(), expected)
+    assert result['patient_id'].to_pylist() == df['patient_id'].tolist()
+
+def test_arrow_null_inpatient(cohort):
+    table = pa.Table.from_pandas(cohort(num_patients = 10), preserve_index = False)
+    inpatient = table['inpatient'].to_pylist()
+    inpatient[3] = None
+    table = table.set_column(table.column_names.index('inpatient'), 'inpatient', pa.array(inpatient))
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        akiFlagger.AKIFlagger().returnAKIpatientsArrow(table)
+    assert list(error.value.rows) == ['inpatient is not boolean']
+    assert error.value.rows['inpatient is not boolean'].tolist() == [3]
+
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True)])
+@pytest.mark.parametrize('window', [dict(start = '2020-02-10'), dict(end = '2020-02-20'), dict(start = '2020-02-10', end = '2020-02-20')])
+def test_arrow_window(cohort, settings, window):
+    df = cohort(num_patients = 50)
+    flagger = akiFlagger.AKIFlagger(**settings)
+    expected = flagger.returnAKIpatients(df.copy(), **window)
+    result = flagger.returnAKIpatients(pa.Table.from_pandas(df, preserve_index = False), **window)
+    assert 0 < result.num_rows < len(df)
+    assert result['time'].to_pylist() == list(expected.index.get_level_values('time'))
+    np.testing.assert_array_equal(result['aki'].to_numpy(), expected['aki'].values)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+def scanAt(flagged, time, min_stage = 1):
+    '''
+    Patients whose latest row at or before the time has a stage of at least min_stage, with that stage.
+    '''
+    rows = flagged.reset_index()
+    rows = rows[rows['time'] <= time].sort_values('time').groupby('patient_id').last()
+    return {(patient, stage) for patient, stage in rows['aki'].items() if stage >= min_stage}
+
+def scanOverlapping(flagged, start, end, min_stage = 1):
+    rows = flagged.reset_index()
+    during = rows[(rows['time'] > start) & (rows['time'] < end) & (rows['aki'] >= min_stage)]['patient_id']
+    return {patient for patient, _ in scanAt(flagged, start, min_stage)} | set(during)
+
+def queryTimes(flagged, num = 25):
+    times = flagged.index.get_level_values('time')
+    return pd.date_range(times.min() - pd.Timedelta('1day'), times.max() + pd.Timedelta('1day'), periods = num).tolist() + list(times[::97])
+
+@pytest.fixture
+def flagged(cohort):
+    return akiFlagger.AKIFlagger().returnAKIpatients(cohort(num_patients = 150))
+
+@pytest.mark.parametrize('leaf_size', [4, 64])
+@pytest.mark.parametrize('min_stage', [1, 2])
+def test_at_matches_scan(flagged, leaf_size, min_stage):
+    census = akiFlagger.AKICensus(flagged, leaf_size = leaf_size)
+    for time in queryTimes(flagged):
+        result = census.at(time, min_stage = min_stage)
+        assert set(zip(result['patient_id'], result['stage'])) == scanAt(flagged, time, min_stage)
+
+def test_overlapping_matches_scan(flagged):
+    census = akiFlagger.AKICensus(flagged, leaf_size = 4)
+    times = queryTimes(flagged)
+    for start, end in zip(times[:-1], times[1:]):
+        if start < end:
+            assert set(census.overlapping(start, end)['patient_id']) == scanOverlapping(flagged, start, end)
+
+@pytest.mark.parametrize('leaf_size', [4, 64])
+def test_update_matches_scan(cohort, leaf_size):
+    df = cohort(num_patients = 150)
+    flagger = akiFlagger.AKIFlagger()
+    full = flagger.returnAKIpatients(df.copy())
+    times = full.index.get_level_values('time')
+    census = akiFlagger.AKICensus(flagger.returnAKIpatients(df[df['time'] < times[len(times)//2]].copy()), leaf_size = leaf_size)
+    for cut in np.quantile(times.values.astype('int64'), [0.5, 0.7, 0.9]).astype('datetime64[ns]'): # Buffered, then rebuilt
+        census.update(full[times >= cut])
+    for time in queryTimes(full):
+        result = census.at(time)
+        assert set(zip(result['patient_id'], result['stage'])) == scanAt(full, time)
+    assert len(census) == len(akiFlagger.AKICensus(full))
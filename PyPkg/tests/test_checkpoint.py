@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+class Crash(Exception):
+    pass
+
+def test_checkpointed_matches_returnAKIpatients(cohort, duplicated, tmp_path):
+    df = duplicated(cohort(num_patients = 60)) # Shuffled, so patients appear out of order
+    flagger = akiFlagger.AKIFlagger(HB_trumping = True)
+    result = flagger.returnAKIpatientsCheckpointed(df.copy(), str(tmp_path), num_shards = 5)
+    pd.testing.assert_frame_equal(result, flagger.returnAKIpatients(df.copy()))
+
+def test_checkpointed_resumes_after_crash(cohort, duplicated, tmp_path, monkeypatch):
+    df = duplicated(cohort(num_patients = 60))
+    flagger = akiFlagger.AKIFlagger(HB_trumping = True)
+    expected = flagger.returnAKIpatients(df.copy())
+
+    calls, crash, flag = [], True, akiFlagger.AKIFlagger.returnAKIpatients
+    def crashing(self, dataframe, *args, **kwargs):
+        calls.append(len(dataframe))
+        if len(calls) == 3 and crash:
+            raise Crash # E.g. the job is killed while flagging the third shard
+        return flag(self, dataframe, *args, **kwargs)
+    monkeypatch.setattr(akiFlagger.AKIFlagger, 'returnAKIpatients', crashing)
+    with pytest.raises(Crash):
+        flagger.returnAKIpatientsCheckpointed(df.copy(), str(tmp_path), num_shards = 5)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.pkl')) == ['shard00000.pkl', 'shard00001.pkl']
+
+    calls.clear()
+    crash = False
+    result = flagger.returnAKIpatientsCheckpointed(df.copy(), str(tmp_path), num_shards = 5)
+    assert len(calls) == 3 # Only the shards that were not completed are flagged again
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_checkpointed_rejects_other_cohort(cohort, tmp_path):
+    flagger = akiFlagger.AKIFlagger()
+    flagger.returnAKIpatientsCheckpointed(cohort(num_patients = 20), str(tmp_path), num_shards = 2)
+    with pytest.raises(ValueError):
+        flagger.returnAKIpatientsCheckpointed(cohort(num_patients = 20, seed = 1), str(tmp_path), num_shards = 2)
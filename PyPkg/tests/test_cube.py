@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+@pytest.fixture
+def flagged(cohort):
+    df = cohort(num_patients = 150)
+    return akiFlagger.AKIFlagger().returnAKIdefinitions(df, {'kdigo': 'KDIGO', 'akin': 'AKIN'})
+
+def test_counts(flagged):
+    cube = akiFlagger.AKICube(flagged, definitions = ['kdigo', 'akin']).data
+    rows = flagged.reset_index()
+    for name in ['kdigo', 'akin']:
+        mine = cube[cube['definition'] == name]
+        assert mine['measurements'].sum() == len(rows)
+        assert mine.groupby('stage')['measurements'].sum().to_dict() == rows[name].value_counts().to_dict()
+        patient_days = rows.assign(day = rows['time'].dt.floor('D')).groupby(['patient_id', 'day', 'inpatient'])[name].max()
+        assert mine['patients'].sum() == len(patient_days)
+        assert (mine.groupby('stage')['patients'].sum() == patient_days.value_counts()).all()
+        onsets = (rows[name] > 0) & ((rows.groupby('patient_id')[name].shift(1).fillna(0)) == 0)
+        assert mine['episodes'].sum() == onsets.sum()
+
+def test_update_matches_rebuild(flagged):
+    times = flagged.index.get_level_values('time')
+    expected = akiFlagger.AKICube(flagged, definitions = ['kdigo', 'akin']).data
+    since = times.min().floor('D') + pd.Timedelta('60days')
+    cube = akiFlagger.AKICube(flagged[times < since], definitions = ['kdigo', 'akin'])
+    for day in [since, since + pd.Timedelta('30days'), since + pd.Timedelta('31days')]: # Daily updates with a day of context
+        cube.update(flagged[times >= day - pd.Timedelta('1day')], since = day)
+    pd.testing.assert_frame_equal(cube.data, expected)
+
+def test_save_load(flagged, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = os.path.join(str(tmp_path), 'cube.parquet')
+    cube = akiFlagger.AKICube(flagged, definitions = ['kdigo', 'akin'])
+    cube.save(path)
+    loaded = akiFlagger.AKICube.load(path, definitions = ['kdigo', 'akin'])
+    pd.testing.assert_frame_equal(loaded.data, cube.data)
+    assert loaded.definitions == ['kdigo', 'akin']
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+dd = pytest.importorskip('dask.dataframe')
+
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True),
+                                      dict(HB_trumping = True, add_baseline_creat = True, add_admission_col = True, add_min_creat = True)])
+def test_dask_processes_matches_pandas(cohort, settings):
+    df = cohort()
+    flagger = akiFlagger.AKIFlagger(**settings)
+    expected = flagger.returnAKIpatients(df.copy()).reset_index()
+
+    ddf = dd.from_pandas(df.sample(frac = 1, random_state = 0), npartitions = 4) # Patients split across partitions
+    result = flagger.returnAKIpatientsDask(ddf).compute(scheduler = 'processes')
+    result = result.sort_values(['patient_id', 'time']).reset_index(drop = True)
+    pd.testing.assert_frame_equal(result.loc[:, expected.columns], expected)
+
+def test_dask_meta_matches_output(cohort):
+    flagger = akiFlagger.AKIFlagger(HB_trumping = True, add_imputed_encounter = True, add_admission_col = True)
+    lazy = flagger.returnAKIpatientsDask(dd.from_pandas(cohort(num_patients = 20), npartitions = 3))
+    result = lazy.compute(scheduler = 'processes')
+    assert lazy.dtypes['imputed_encounter_id'] == 'Int64'
+    pd.testing.assert_series_equal(result.dtypes, lazy.dtypes)
+
+def test_dask_missing_column(cohort):
+    df = cohort(num_patients = 5).drop(columns = 'time')
+    with pytest.raises(akiFlagger.FlaggerInputError):
+        akiFlagger.AKIFlagger().returnAKIpatientsDask(dd.from_pandas(df, npartitions = 2))
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+@pytest.mark.parametrize('settings', [dict(), dict(padding = '4hours'), dict(padding = None, pad1time = '10hours'),
+                                      dict(padding = None, pad2time = '12hours'), dict(padding = None, pad1time = '10hours', pad2time = '1day')])
+def test_kdigo_definition_matches_flagger(cohort, settings):
+    flagger = akiFlagger.AKIFlagger(**settings)
+    df = cohort(num_patients = 150)
+    expected = flagger.returnAKIpatients(df.copy())['aki']
+    result = flagger.returnAKIdefinitions(df.copy(), {'kdigo': 'KDIGO'})['kdigo']
+    pd.testing.assert_series_equal(result, expected, check_names = False)
+
+def test_rule_needs_one_threshold():
+    with pytest.raises(ValueError):
+        akiFlagger.AKIRule(1, '48hours')
+    with pytest.raises(ValueError):
+        akiFlagger.AKIRule(1, '48hours', ratio = 1.5, increase = 0.3)
+
+def bruteForce(df, rules, pad):
+    '''
+    Stage of every row by scanning each patient's labs in every rule's (padded) window.
+    '''
+    stages = []
+    for (patient, time), creat in df['creatinine'].items():
+        labs = df.loc[patient]['creatinine']
+        stage = 0
+        for rule in rules:
+            window = labs[(labs.index > time - pd.Timedelta(rule.window) - pad) & (labs.index <= time)]
+            reference = {'min': window.min(), 'mean': window.mean(), 'first': window.iloc[0]}[rule.reference]
+            threshold = rule.ratio*reference if rule.ratio is not None else rule.increase + reference
+            if round(creat, 4) >= round(threshold, 4) and (rule.at_least is None or creat >= rule.at_least):
+                stage = max(stage, rule.stage)
+        stages.append(stage)
+    return stages
+
+@pytest.fixture
+def scaled(cohort):
+    df = cohort(num_patients = 40)
+    high = df['patient_id'].isin(df['patient_id'].unique()[::3]) # Some patients with creatinine high enough for the 4.0 rules
+    df.loc[high, 'creatinine'] = (df.loc[high, 'creatinine']*3.5).round(2)
+    return df
+
+@pytest.mark.parametrize('definition', ['AKIN', 'RIFLE'])
+def test_definition_matches_brute_force(scaled, definition):
+    flagger = akiFlagger.AKIFlagger(padding = '4hours')
+    result = flagger.returnAKIdefinitions(scaled.copy(), {'stage': definition})
+    expected = bruteForce(result, akiFlagger.DEFINITIONS[definition], pd.Timedelta('4hours') + pd.Timedelta('1s'))
+    assert result['stage'].tolist() == expected
+    without = flagger.returnAKIdefinitions(scaled.copy(), {'stage': [rule for rule in akiFlagger.DEFINITIONS[definition] if rule.at_least is None]})
+    assert (result['stage'] != without['stage']).any() # The 4.0 rule decides some of the stages
+
+@pytest.mark.parametrize('reference', akiFlagger.RULE_REFERENCES)
+def test_reference_statistics(scaled, reference):
+    rules = [akiFlagger.AKIRule(1, '48hours', increase = 0.3, reference = reference), akiFlagger.AKIRule(2, '168hours', ratio = 1.5, reference = reference),
+             akiFlagger.AKIRule(3, '168hours', increase = 0.5, at_least = 4.0, reference = reference)]
+    result = akiFlagger.AKIFlagger(padding = None).returnAKIdefinitions(scaled.copy(), {'stage': rules})
+    assert result['stage'].tolist() == bruteForce(result, rules, pd.Timedelta('1s'))
+
+def test_invalid_reference():
+    with pytest.raises(ValueError):
+        akiFlagger.AKIRule(1, '48hours', ratio = 1.5, reference = 'median')
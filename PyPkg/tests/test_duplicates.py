@@ -0,0 +1,18 @@
+import pytest
+
+import akiFlagger
+
+@pytest.mark.parametrize('engine', ['pandas', 'numpy'])
+@pytest.mark.parametrize('string_ids', [False, True])
+def test_output_sorted_by_patient(cohort, duplicated, engine, string_ids):
+    df = duplicated(cohort(num_patients = 50)) # Shuffled, so patients appear out of order
+    if string_ids:
+        df['patient_id'] = 'MR' + (df['patient_id']*7).astype('str')
+    result = akiFlagger.AKIFlagger(engine = engine).returnAKIpatients(df.copy())
+    assert result.index.is_monotonic_increasing
+    assert not result.index.duplicated().any()
+    assert len(result) == len(df.drop_duplicates(['patient_id', 'time']))
+
+def test_invalid_duplicates_policy():
+    with pytest.raises(ValueError):
+        akiFlagger.AKIFlagger(duplicates = 'median')
@@ -0,0 +1,23 @@
+import pytest
+
+import akiFlagger
+
+INTERMEDIATE = dict(add_min_creat = True, add_baseline_creat = True, add_admission_col = True, add_imputed_encounter = True)
+
+@pytest.mark.parametrize('engine', ['pandas', 'numpy'])
+@pytest.mark.parametrize('settings', [dict(), dict(prune = False), dict(HB_trumping = True), dict(HB_trumping = True, **INTERMEDIATE)])
+def test_empty_input(cohort, engine, settings):
+    flagger = akiFlagger.AKIFlagger(engine = engine, **settings)
+    df = cohort(num_patients = 10)
+    expected = flagger.returnAKIpatients(df.copy())
+    result = flagger.returnAKIpatients(df.iloc[:0].copy())
+    assert result.shape[0] == 0
+    assert list(result.columns) == list(expected.columns)
+
+def test_reporting_window_without_rows(cohort):
+    df = cohort(num_patients = 10)
+    assert akiFlagger.AKIFlagger().returnAKIpatients(df, start = '2030-01-01').shape[0] == 0
+
+def test_checkpointed_empty_input(cohort, tmp_path):
+    df = cohort(num_patients = 10).iloc[:0]
+    assert akiFlagger.AKIFlagger().returnAKIpatientsCheckpointed(df, str(tmp_path)).shape[0] == 0
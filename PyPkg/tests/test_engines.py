@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+INTERMEDIATE = dict(add_min_creat = True, add_baseline_creat = True, add_admission_col = True, add_imputed_encounter = True)
+
+SETTINGS = [dict(), dict(INTERMEDIATE), dict(HB_trumping = True), dict(HB_trumping = True, **INTERMEDIATE),
+            dict(HB_trumping = True, eGFR_impute = True, sex = 'female', **INTERMEDIATE), dict(padding = None),
+            dict(add_reference = True), dict(HB_trumping = True, add_reference = True)]
+
+def assertSameAsPandas(df, engine, settings):
+    expected = akiFlagger.AKIFlagger(engine = 'pandas', **settings).returnAKIpatients(df.copy())
+    result = akiFlagger.AKIFlagger(engine = engine, **settings).returnAKIpatients(df.copy())
+    assert 'aki' in result.columns
+    pd.testing.assert_frame_equal(result, expected) # The aki column and every intermediate column
+
+@pytest.mark.parametrize('engine', ['numpy', 'numba'])
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_engine_matches_pandas(cohort, engine, settings):
+    assertSameAsPandas(cohort(num_patients = 150, demographics = True), engine, settings)
+
+@pytest.mark.parametrize('engine', ['numpy', 'numba'])
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True, **INTERMEDIATE)])
+def test_engine_string_ids(cohort, engine, settings):
+    df = cohort(num_patients = 100)
+    df['patient_id'] = 'MR' + (df['patient_id']*7919).astype('str')
+    assertSameAsPandas(df, engine, settings)
+
+@pytest.mark.parametrize('engine', ['numpy', 'numba'])
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True, **INTERMEDIATE), dict(padding = None)])
+def test_engine_sub_minute_times(cohort, engine, settings):
+    df = cohort(num_patients = 100)
+    rng = np.random.default_rng(0)
+    df['time'] = df['time'] + pd.to_timedelta(rng.integers(0, 60*10**6, len(df)), unit = 'us') # Seconds & microseconds
+    df = df.sort_values(['patient_id', 'time']).drop_duplicates(['patient_id', 'time']).reset_index(drop = True)
+    assertSameAsPandas(df, engine, settings)
+
+def test_invalid_engine():
+    with pytest.raises(ValueError):
+        akiFlagger.AKIFlagger(engine = 'numPy')
+
+@pytest.mark.parametrize('engine', ['numpy', 'numba'])
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True, **INTERMEDIATE), dict(HB_trumping = True, add_reference = True)])
+def test_threads_give_identical_output(cohort, engine, settings):
+    df = cohort(num_patients = 150)
+    expected = akiFlagger.AKIFlagger(engine = engine, **settings).returnAKIpatients(df.copy())
+    for num_threads in [2, 7]:
+        result = akiFlagger.AKIFlagger(engine = engine, num_threads = num_threads, **settings).returnAKIpatients(df.copy())
+        pd.testing.assert_frame_equal(result, expected)
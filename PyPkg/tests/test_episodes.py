@@ -0,0 +1,29 @@
+import pandas as pd
+
+import akiFlagger
+
+T, D = pd.Timestamp, pd.Timedelta
+
+def flaggedCohort():
+    rows = [(1, '2020-01-01', 1.0, 0), (1, '2020-01-02', 1.6, 1), (1, '2020-01-03', 2.1, 2), (1, '2020-01-05', 1.2, 0), # Recovered in 3 days
+            (1, '2020-01-10', 1.6, 1), (1, '2020-02-01', 1.5, 0), (1, '2020-03-01', 1.2, 0),                         # Recovered in 51 days
+            (2, '2020-01-01', 1.0, 0), (2, '2020-01-02', 2.0, 2), (2, '2020-01-03', 1.9, 2),                         # 1 day of follow-up
+            (3, '2020-01-01', 1.0, 0), (3, '2020-01-02', 2.0, 2), (3, '2020-06-01', 1.8, 0),                         # Never recovers
+            (4, '2020-01-01', 1.0, 0), (4, '2020-01-02', 3.1, 3), (4, '2020-01-20', 1.8, 0)]                         # Not yet recovered
+    df = pd.DataFrame([dict(patient_id = p, time = T(t), creatinine = c, aki = a) for p, t, c, a in rows])
+    return df.assign(reference_creat = 1.0).set_index(['patient_id', 'time'])
+
+def test_episodes():
+    result = akiFlagger.AKIFlagger().returnAKIepisodes(flaggedCohort())
+    assert result['patient_id'].tolist() == [1, 1, 2, 3, 4]
+    assert result['onset'].tolist() == [T('2020-01-02'), T('2020-01-10'), T('2020-01-02'), T('2020-01-02'), T('2020-01-02')]
+    assert result['stage'].tolist() == [2, 1, 2, 2, 3] # The highest stage before recovery
+    assert result['reference_creat'].tolist() == [1.0]*5
+    assert result['recovery'].tolist()[:2] == [T('2020-01-05'), T('2020-03-01')] and result['recovery'][2:].isnull().all()
+    assert result['time_to_recovery'].tolist()[:2] == [D('3days'), D('51days')]
+    assert result['status'].tolist() == ['recovered', 'AKD', 'censored', 'persistent', 'AKD']
+
+def test_recovery_threshold():
+    result = akiFlagger.AKIFlagger().returnAKIepisodes(flaggedCohort(), recovery = 0.5) # 1.5 now counts as recovered
+    assert result['recovery'].tolist()[:2] == [T('2020-01-05'), T('2020-02-01')]
+    assert result['status'].tolist()[:2] == ['recovered', 'AKD']
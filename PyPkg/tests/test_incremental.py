@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+def labs(*rows):
+    return pd.DataFrame([dict(patient_id = 1, time = pd.Timestamp(time), creatinine = creat, inpatient = True) for time, creat in rows])
+
+@pytest.mark.parametrize('duplicates', akiFlagger.DUPLICATE_POLICIES)
+def test_incremental_duplicate_policies(duplicates):
+    old, new = labs(('2020-01-01', 1.0), ('2020-01-02', 1.1)), labs(('2020-01-02', 2.5))
+    flagger = akiFlagger.AKIFlagger(duplicates = duplicates)
+    expected = flagger.returnAKIpatients(pd.concat([old, new], ignore_index = True))
+    result = flagger.returnAKIpatientsIncremental(flagger.returnAKIpatients(old.copy()), new)
+    pd.testing.assert_series_equal(result['aki'], expected['aki'])
+    pd.testing.assert_series_equal(result['creatinine'], expected['creatinine'])
+
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True), dict(HB_trumping = True, add_min_creat = True)])
+def test_incremental_matches_full_run(cohort, settings):
+    df = cohort(num_patients = 80)
+    cuts = df['time'].quantile([0.5, 0.7, 0.9]).tolist()
+    batches = [df[df['time'] < cuts[0]]] + [df[(df['time'] >= lo) & (df['time'] < hi)] for lo, hi in zip(cuts, cuts[1:] + [df['time'].max() + pd.Timedelta('1s')])]
+    flagger = akiFlagger.AKIFlagger(**settings)
+    result = flagger.returnAKIpatients(batches[0].copy())
+    for batch in batches[1:]:
+        result = flagger.returnAKIpatientsIncremental(result, batch.copy())
+    expected = flagger.returnAKIpatients(df.copy())
+    assert len(result) == len(expected)
+    columns = ['aki'] + [col for col in expected.columns if col.startswith('min_creat')]
+    pd.testing.assert_frame_equal(result.sort_index().loc[:, columns], expected.sort_index().loc[:, columns])
+
+def test_incremental_empty_batch(cohort):
+    df = cohort(num_patients = 20)
+    flagger = akiFlagger.AKIFlagger(HB_trumping = True)
+    flagged = flagger.returnAKIpatients(df.copy())
+    result = flagger.returnAKIpatientsIncremental(flagged, df.iloc[:0])
+    pd.testing.assert_frame_equal(result, flagged)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import akiFlagger
+
+def bruteForce(y_true, score, threshold = 1):
+    pred = score >= threshold
+    TP, FP = np.sum(pred & y_true), np.sum(pred & ~y_true)
+    FN, TN = np.sum(~pred & y_true), np.sum(~pred & ~y_true)
+    pairs = [(p > q) + 0.5*(p == q) for p in score[y_true] for q in score[~y_true]] # Mann-Whitney U over every (positive, negative) pair
+    return {'SENS': TP/(TP + FN), 'SPEC': TN/(TN + FP), 'PPV': TP/(TP + FP), 'NPV': TN/(TN + FN), 'F1': 2*TP/(2*TP + FP + FN),
+            'AUC': np.mean(pairs)}
+
+@pytest.fixture
+def outcomes():
+    rng = np.random.default_rng(0)
+    score = rng.integers(0, 4, 300)
+    y_true = rng.random(300) < 0.15 + 0.2*score
+    return y_true, score
+
+@pytest.mark.parametrize('threshold', [1, 2])
+def test_point_estimates_match_brute_force(outcomes, threshold):
+    y_true, score = outcomes
+    result = akiFlagger.bootstrap_metrics(y_true, score, num_replicates = 50, threshold = threshold, seed = 0).loc['aki']
+    expected = bruteForce(y_true, score, threshold)
+    np.testing.assert_allclose(result['estimate'].values, [expected[metric] for metric in result.index])
+    assert (result['lower'] <= result['estimate']).all() and (result['estimate'] <= result['upper']).all()
+
+def test_definitions_share_resamples(outcomes):
+    y_true, score = outcomes
+    result = akiFlagger.bootstrap_metrics(y_true, {'a': score, 'b': score}, num_replicates = 50, seed = 0)
+    np.testing.assert_array_equal(result.loc['a'].values, result.loc['b'].values)
+
+def test_no_replicates(outcomes):
+    y_true, score = outcomes
+    result = akiFlagger.bootstrap_metrics(y_true, score, num_replicates = 0)
+    assert result['lower'].isnull().all() and result['upper'].isnull().all()
+    np.testing.assert_allclose(result.loc['aki', 'estimate'].values, list(bruteForce(y_true, score).values()))
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+def extract():
+    return pd.DataFrame({'mrn': [1, 1, 2, 2, 3], 'taken': ['01/02/2020 08:00', '01/03/2020 09:30', '01/02/2020 08:00', '02/11/2020 23:15', '03/01/2020 00:00'],
+                         'cr': [88.4, 1.5, 176.8, 0.1, 1.2], 'unit': ['umol/L', 'mg/dL', 'µmol/L', 'mmol/L', 'MG/DL'],
+                         'ip': ['Y', 'inpatient', 'no', 0, 'TRUE']})
+
+def normalizer(**kwargs):
+    return akiFlagger.InputNormalizer(schema = {'mrn': 'patient_id', 'taken': 'time', 'cr': 'creatinine', 'ip': 'inpatient'}, **kwargs)
+
+def test_units_encodings_and_times():
+    df = normalizer(creatinine_unit = 'unit').normalize(extract())
+    np.testing.assert_allclose(df['creatinine'].values, [1.0, 1.5, 2.0, 100/88.4, 1.2])
+    assert df['inpatient'].tolist() == [True, True, False, False, True]
+    assert df['time'].tolist()[:2] == [pd.Timestamp('2020-01-02 08:00'), pd.Timestamp('2020-01-03 09:30')] # Month first
+    assert 'aki' in akiFlagger.AKIFlagger().returnAKIpatients(df.drop(columns = 'unit')).columns
+
+def test_fixed_unit_and_outpatient_column():
+    df = extract().assign(cr = [88.4]*5).rename(columns = {'ip': 'op'})
+    df = normalizer(creatinine_unit = 'umol/L', outpatient = 'op').normalize(df)
+    np.testing.assert_allclose(df['creatinine'].values, 1.0)
+    assert df['inpatient'].tolist() == [False, False, True, True, False]
+
+def test_invalid_rows():
+    df = extract()
+    df.loc[[1, 3], 'unit'] = 'mg'
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        normalizer(creatinine_unit = 'unit').normalize(df)
+    assert error.value.rows['unit is not a known unit'].tolist() == [1, 3]
+
+    df = extract()
+    df.loc[2, 'ip'] = 'maybe'
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        normalizer(creatinine_unit = 'unit').normalize(df)
+    assert error.value.rows['inpatient is not a boolean encoding'].tolist() == [2]
+
+    with pytest.raises(akiFlagger.FlaggerInputError):
+        normalizer(creatinine_unit = 'mg').normalize(extract())
+
+def test_chunks_reuse_the_first_format():
+    norm = normalizer(creatinine_unit = 'unit')
+    chunks = list(norm.normalizeChunks([extract().iloc[:2], extract().iloc[2:]]))
+    assert norm.time_format == '%m/%d/%Y %H:%M'
+    assert chunks[1]['time'].tolist()[0] == pd.Timestamp('2020-01-02 08:00')
+    bad = extract().iloc[2:].assign(taken = ['2020-01-02', '2020-02-11', '2020-03-01']) # Another format than the first chunk
+    with pytest.raises(akiFlagger.FlaggerInputError):
+        norm.normalize(bad)
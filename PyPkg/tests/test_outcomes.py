@@ -0,0 +1,35 @@
+import pandas as pd
+
+import akiFlagger
+
+T = pd.Timestamp
+
+def flaggedCohort():
+    rows = [(1, '2020-01-01', 0), (1, '2020-01-02', 1), (1, '2020-01-03', 2), # Anchor on the first flag
+            (2, '2020-01-05', 0), (2, '2020-01-06', 0),                       # Never flagged: anchor on the first row
+            (3, '2020-01-08', 0), (3, '2020-01-10', 1)]
+    return pd.DataFrame([dict(patient_id = p, time = T(t), aki = a) for p, t, a in rows]).set_index(['patient_id', 'time'])
+
+def events():
+    rows = [(1, '2020-01-01', 'dialysis'), (1, '2020-01-20', 'death'), (1, '2020-02-15', 'dialysis'), # The first dialysis precedes the anchor
+            (2, '2020-01-06', 'death'), (3, '2020-01-10', 'dialysis'), (9, '2020-01-01', 'death')]  # Patient 9 was never flagged
+    return pd.DataFrame([dict(patient_id = p, time = T(t), event = e) for p, t, e in rows])
+
+WINDOWS = {'death7d': ('death', '7days'), 'death30d': ('death', '30days'), 'dialysis30d': ('dialysis', '30days'), 'dialysis': ('dialysis', None)}
+
+def test_window_labels():
+    result = akiFlagger.AKIFlagger().alignOutcomes(flaggedCohort(), events(), WINDOWS)
+    assert result.index.tolist() == [1, 2, 3]
+    assert result['aki'].tolist() == [2, 0, 1]
+    assert result['anchor'].tolist() == [T('2020-01-02'), T('2020-01-05'), T('2020-01-10')]
+    assert result['death_time'].tolist()[:2] == [T('2020-01-20'), T('2020-01-06')] and pd.isnull(result.loc[3, 'death_time'])
+    assert result['dialysis_time'].tolist()[::2] == [T('2020-02-15'), T('2020-01-10')] and pd.isnull(result.loc[2, 'dialysis_time'])
+    assert result['death7d'].tolist() == [False, True, False]
+    assert result['death30d'].tolist() == [True, True, False]
+    assert result['dialysis30d'].tolist() == [False, False, True] # An event at the anchor itself counts
+    assert result['dialysis'].tolist() == [True, False, True]
+
+def test_min_stage():
+    result = akiFlagger.AKIFlagger().alignOutcomes(flaggedCohort(), events(), WINDOWS, min_stage = 2)
+    assert result['anchor'].tolist() == [T('2020-01-03'), T('2020-01-05'), T('2020-01-08')]
+    assert result['dialysis30d'].tolist() == [False, False, True]
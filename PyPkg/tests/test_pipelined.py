@@ -0,0 +1,49 @@
+import asyncio, os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+@pytest.fixture
+def extracts(cohort, tmp_path):
+    df = cohort(num_patients = 60)
+    paths = []
+    for i, patients in enumerate(np.array_split(df['patient_id'].unique(), 5)):
+        path = os.path.join(str(tmp_path), 'extract{}.csv'.format(i))
+        df[df['patient_id'].isin(patients)].to_csv(path, index = False)
+        paths.append(path)
+    os.makedirs(os.path.join(str(tmp_path), 'out'))
+    return paths, os.path.join(str(tmp_path), 'out')
+
+def assertFlagged(flagger, paths, outputs):
+    for path, output in zip(paths, outputs):
+        expected = flagger.returnAKIpatients(akiFlagger.InputNormalizer(flagger = flagger).normalize(pd.read_csv(path)))
+        result = pd.read_csv(output, parse_dates = ['time']).set_index(['patient_id', 'time'])
+        pd.testing.assert_series_equal(result['aki'], expected['aki'])
+
+@pytest.mark.parametrize('max_queued', [1, 2])
+def test_pipelined_output(extracts, max_queued):
+    paths, directory = extracts
+    flagger = akiFlagger.AKIFlagger(HB_trumping = True)
+    outputs = flagger.returnAKIpatientsPipelined(paths, directory, max_queued = max_queued)
+    assert outputs == [os.path.join(directory, os.path.basename(path)) for path in paths]
+    assertFlagged(flagger, paths, outputs)
+
+def test_pipelined_inside_event_loop(extracts):
+    paths, directory = extracts
+    flagger = akiFlagger.AKIFlagger()
+    async def main(): # E.g. in Jupyter
+        return flagger.returnAKIpatientsPipelined(paths, directory)
+    assertFlagged(flagger, paths, asyncio.run(main()))
+
+def test_pipelined_propagates_errors(extracts):
+    paths, directory = extracts
+    df = pd.read_csv(paths[2])
+    df.loc[3, 'creatinine'] = -1.0
+    df.to_csv(paths[2], index = False)
+    with pytest.raises(akiFlagger.FlaggerInputError):
+        akiFlagger.AKIFlagger().returnAKIpatientsPipelined(paths, directory, max_queued = 1)
+    with pytest.raises(FileNotFoundError):
+        akiFlagger.AKIFlagger().returnAKIpatientsPipelined(paths[:1] + ['missing.csv'], directory)
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+pl = pytest.importorskip('polars')
+
+SETTINGS = [dict(), dict(HB_trumping = True), dict(HB_trumping = True, eGFR_impute = True, sex = 'female'),
+            dict(HB_trumping = True, add_min_creat = True, add_baseline_creat = True, add_admission_col = True, add_imputed_encounter = True),
+            dict(padding = None)]
+
+def assertSameAsPandas(flagger, df):
+    expected = flagger.returnAKIpatients(df.copy()).reset_index()
+    expected = expected.sort_values([flagger.patient_id, flagger.time]).reset_index(drop = True)
+    result = flagger.returnAKIpatientsPolars(pl.from_pandas(df)).to_pandas()
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype = False)
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_polars_matches_pandas(cohort, settings):
+    assertSameAsPandas(akiFlagger.AKIFlagger(**settings), cohort(num_patients = 100, demographics = True))
+
+@pytest.mark.parametrize('duplicates', akiFlagger.DUPLICATE_POLICIES)
+@pytest.mark.parametrize('settings', SETTINGS[:2])
+def test_polars_duplicate_policies(cohort, duplicated, settings, duplicates):
+    assertSameAsPandas(akiFlagger.AKIFlagger(duplicates = duplicates, **settings), duplicated(cohort(num_patients = 100)))
+
+def test_polars_lazy_stays_lazy(cohort):
+    result = akiFlagger.AKIFlagger().returnAKIpatientsPolars(pl.from_pandas(cohort(num_patients = 10)).lazy())
+    assert isinstance(result, pl.LazyFrame)
+
+def test_polars_validation(cohort):
+    df = pl.from_pandas(cohort(num_patients = 10)).with_columns(
+        pl.when(pl.int_range(pl.len()) == 3).then(None).otherwise(pl.col('inpatient')).alias('inpatient'))
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        akiFlagger.AKIFlagger().returnAKIpatientsPolars(df)
+    assert error.value.rows['inpatient is not boolean'].tolist() == [3]
+    with pytest.raises(akiFlagger.FlaggerInputError):
+        akiFlagger.AKIFlagger().returnAKIpatientsPolars(df.drop('creatinine'))
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import akiFlagger
+
+@pytest.mark.parametrize('engine', ['pandas', 'numpy'])
+@pytest.mark.parametrize('HB_trumping', [False, True])
+def test_reference_is_a_lab_in_the_window(cohort, engine, HB_trumping):
+    flagger = akiFlagger.AKIFlagger(engine = engine, HB_trumping = HB_trumping, add_reference = True, add_min_creat = True, add_baseline_creat = HB_trumping)
+    df = flagger.returnAKIpatients(cohort(num_patients = 200)).reset_index()
+    windows = {flagger._minCreatColumn(flagger.cond1time): flagger.cond1time, flagger._minCreatColumn(flagger.cond2time): flagger.cond2time}
+    labs = df.set_index(['patient_id', 'time'])['creatinine']
+    flags = df[df['aki'] > 0]
+    assert len(flags) > 0
+
+    rolling = flags[flags['reference'].isin(list(windows))]
+    assert len(rolling) > 0
+    for _, row in rolling.iterrows():
+        assert row['time'] - windows[row['reference']] < row['reference_time'] <= row['time'] # Inside the rolling window
+        assert labs[(row['patient_id'], row['reference_time'])] == row['reference_creat'] # ... and an actual lab
+        assert row['reference_creat'] == row[row['reference']] # The rolling minimum the row was compared against
+        assert round(row['creatinine'], 4) >= round(min(1.5*row['reference_creat'], row['reference_creat'] + 0.3), 4)
+
+    baseline = flags[flags['reference'] == 'baseline_creat']
+    if HB_trumping:
+        assert len(baseline) > 0 and len(rolling) + len(baseline) == len(flags)
+        assert baseline['reference_time'].isnull().all()
+        np.testing.assert_array_equal(baseline['reference_creat'].values, baseline['baseline_creat'].values)
+    else:
+        assert len(baseline) == 0 and len(rolling) == len(flags)
@@ -0,0 +1,32 @@
+import os
+
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True)])
+def test_snapshot_then_incremental_matches_full_run(cohort, tmp_path, settings):
+    df = cohort(num_patients = 100)
+    df = pd.concat([df.assign(time = df['time'] - pd.Timedelta('60days')), df]).sort_values(['patient_id', 'time']).reset_index(drop = True) # Older history
+    cut = df['time'].quantile(0.7)
+    old, new = df[df['time'] < cut], df[df['time'] >= cut]
+    flagger = akiFlagger.AKIFlagger(**settings)
+    path = os.path.join(str(tmp_path), 'state.pkl')
+
+    state = flagger.snapshotState(flagger.returnAKIpatients(old.copy()), path)
+    assert len(state) < len(old) # Only the rows within the look-back horizons are kept
+    restored = flagger.restoreState(path)
+    pd.testing.assert_frame_equal(restored, state)
+
+    result = flagger.returnAKIpatientsIncremental(restored, new.copy())
+    expected = flagger.returnAKIpatients(df.copy())
+    rows = new.set_index(['patient_id', 'time']).index
+    pd.testing.assert_series_equal(result['aki'].loc[rows], expected['aki'].loc[rows])
+
+def test_restore_rejects_other_settings(cohort, tmp_path):
+    path = os.path.join(str(tmp_path), 'state.pkl')
+    flagger = akiFlagger.AKIFlagger()
+    flagger.snapshotState(flagger.returnAKIpatients(cohort(num_patients = 10)), path)
+    with pytest.raises(ValueError):
+        akiFlagger.AKIFlagger(HB_trumping = True).restoreState(path)
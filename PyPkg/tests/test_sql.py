@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+duckdb = pytest.importorskip('duckdb')
+
+SETTINGS = [dict(), dict(HB_trumping = True), dict(HB_trumping = True, eGFR_impute = True, sex = 'female'),
+            dict(padding = None, pad1time = '10hours'), dict(add_min_creat = True)]
+
+def assertSameAsPandas(flagger, df):
+    expected = flagger.returnAKIpatients(df.copy()).reset_index()
+    result = flagger.returnAKIpatientsSQL(df).df()
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected, check_dtype = False)
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_sql_matches_pandas(cohort, settings):
+    assertSameAsPandas(akiFlagger.AKIFlagger(**settings), cohort(num_patients = 100, demographics = True))
+
+@pytest.mark.parametrize('duplicates', ['max', 'mean'])
+def test_sql_duplicate_policies(cohort, duplicated, duplicates):
+    assertSameAsPandas(akiFlagger.AKIFlagger(duplicates = duplicates), duplicated(cohort(num_patients = 100)))
+
+def test_sql_results_keep_their_input(cohort):
+    flagger = akiFlagger.AKIFlagger()
+    a, b = cohort(num_patients = 10), cohort(num_patients = 20, seed = 1)
+    ra = flagger.returnAKIpatientsSQL(a)
+    rb = flagger.returnAKIpatientsSQL(b)
+    assert len(ra.df()) == len(a) and len(rb.df()) == len(b)
+    assert set(ra.df()['patient_id']) == set(a['patient_id'])
@@ -0,0 +1,42 @@
+import os, subprocess, sys
+
+import pytest
+
+import akiFlagger
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+COLD_START_RATIO = 1.0 # Budget of 'import akiFlagger' on top of NumPy, relative to 'import numpy' in the same fresh interpreter
+BENCHMARKS = os.environ.get('AKIFLAGGER_BENCHMARKS') == '1' # Wall-clock tests are flaky on loaded machines, so they are opt-in
+
+FLAG_ARRAYS = '''
+import sys, time
+start = time.perf_counter()
+import numpy as np
+numpy = time.perf_counter() - start
+import akiFlagger
+elapsed = time.perf_counter() - start - numpy
+aki = akiFlagger.AKIFlagger(HB_trumping = True).returnAKIarrays(
+    [1, 1, 1], np.array(['2020-01-01T00', '2020-01-02T00', '2020-01-03T00'], dtype = 'datetime64[ns]'), [1.0, 1.4, 2.1], [True, True, True])
+assert aki.tolist() == [0, 1, 2], aki
+print(numpy, elapsed, 'pandas.core.frame' in sys.modules)
+'''
+
+def runFresh(code):
+    env = dict(os.environ, PYTHONPATH = SRC + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    output = subprocess.run([sys.executable, '-c', code], env = env, check = True, capture_output = True, text = True).stdout
+    return output.split()
+
+def test_array_path_never_loads_pandas():
+    _, _, loaded = runFresh(FLAG_ARRAYS)
+    assert loaded == 'False'
+
+@pytest.mark.skipif(not BENCHMARKS, reason = 'benchmark; set AKIFLAGGER_BENCHMARKS=1 to run')
+def test_cold_start_budget():
+    runFresh(FLAG_ARRAYS) # Warm the file system cache & bytecode
+    numpy, elapsed = min((tuple(map(float, runFresh(FLAG_ARRAYS)[:2])) for _ in range(3)), key = lambda run: run[1]/run[0])
+    assert elapsed < COLD_START_RATIO*numpy, "import akiFlagger took {:.3f}s on top of NumPy's {:.3f}s".format(elapsed, numpy)
+
+def test_missing_module_raises_on_use():
+    module = akiFlagger._lazyImport('not_an_installed_module_akiflagger')
+    with pytest.raises(ImportError, match = 'not_an_installed_module_akiflagger'):
+        module.DataFrame
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+@pytest.fixture
+def history():
+    '''
+    One patient with 3000 labs every 6 hours (a slow random walk with occasional spikes), next to a short toy cohort.
+    '''
+    rng = np.random.default_rng(0)
+    creat = np.clip(1 + np.cumsum(rng.normal(0, 0.02, 3000)), 0.5, None) + np.where(rng.random(3000) < 0.01, 1.0, 0)
+    long = pd.DataFrame({'patient_id': 1, 'time': pd.date_range('2015-01-01', periods = 3000, freq = '6H'),
+                         'creatinine': creat.round(2), 'inpatient': True})
+    short = pd.DataFrame({'patient_id': 2, 'time': pd.date_range('2015-01-01', periods = 20, freq = '1D'), 'creatinine': 1.0, 'inpatient': True})
+    return pd.concat([long, short], ignore_index = True)
+
+@pytest.mark.parametrize('add_reference', [False, True])
+def test_keeps_aki_rows_and_references(history, add_reference):
+    flagger = akiFlagger.AKIFlagger(add_reference = add_reference)
+    flagged = flagger.returnAKIpatients(history)
+    rows = flagged.xs(1, level = 'patient_id')
+    result = flagger.returnTrajectory(flagged, 1, num_points = 200)
+
+    aki = rows[rows['aki'] > 0]
+    assert 0 < len(aki) and len(result) < 200 + 3*len(aki)
+    assert result.index.is_monotonic_increasing
+    assert rows.index[0] in result.index and rows.index[-1] in result.index # The end points of the curve
+    assert aki.index.isin(result.index).all() # Every AKI row
+    pd.testing.assert_frame_equal(result, rows.loc[result.index]) # ... with its values unchanged
+    if add_reference: # ... and the lab it was measured against
+        assert pd.Index(aki['reference_time'].dropna()).isin(result.index).all()
+    else: # ... or, not knowing which, the minimum of each of its rolling windows
+        for time in aki.index:
+            for window in (flagger.cond1time, flagger.cond2time):
+                labs = rows['creatinine'][(rows.index > time - window) & (rows.index <= time)]
+                kept = result['creatinine'][(result.index > time - window) & (result.index <= time)]
+                assert kept.min() == labs.min()
+
+def test_short_history_is_kept_whole(history):
+    flagged = akiFlagger.AKIFlagger().returnAKIpatients(history)
+    pd.testing.assert_frame_equal(akiFlagger.AKIFlagger().returnTrajectory(flagged, 2), flagged.xs(2, level = 'patient_id'))
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+def invalidCohort(cohort):
+    df = cohort(num_patients = 20)
+    df['inpatient'] = df['inpatient'].astype('object')
+    df.loc[[2, 7], 'creatinine'] = [np.nan, -1.0]
+    df.loc[5, 'time'] = pd.NaT
+    df.loc[9, 'inpatient'] = 'yes'
+    return df
+
+def test_reports_every_invalid_row(cohort):
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        akiFlagger.AKIFlagger().returnAKIpatients(invalidCohort(cohort))
+    rows = {check: idx.tolist() for check, idx in error.value.rows.items()}
+    assert rows == {'creatinine is null': [2], 'creatinine is non-positive': [7], 'time is null': [5], 'inpatient is not boolean': [9]}
+    assert 'creatinine is null at 1 row(s) [2]' in str(error.value)
+    assert isinstance(error.value, AssertionError) and isinstance(error.value, ValueError)
+
+def test_reports_positions_for_iloc(cohort):
+    df = cohort(num_patients = 20)
+    df.index = df.index[::-1] + 1000 # Positions, not labels
+    df.iloc[[3, 15], df.columns.get_loc('creatinine')] = np.nan
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        akiFlagger.AKIFlagger().validateInput(df)
+    assert error.value.rows['creatinine is null'].tolist() == [3, 15]
+
+def test_validate_false_skips_value_scan(cohort, monkeypatch):
+    def scanned(checks, source = 'dataframe'):
+        raise AssertionError("The values were scanned")
+    monkeypatch.setattr(akiFlagger, '_raiseInvalidValues', scanned)
+    df = invalidCohort(cohort)
+    akiFlagger.AKIFlagger().validateInput(df, check_values = False)
+    df = df.drop(index = [2, 5]) # The rows the flagger can't sort or compare
+    df['inpatient'] = df['inpatient'] == True
+    assert 'aki' in akiFlagger.AKIFlagger(validate = False).returnAKIpatients(df).columns
+
+@pytest.mark.parametrize('column', ['patient_id', 'time', 'inpatient', 'creatinine'])
+def test_missing_column(cohort, column):
+    with pytest.raises(akiFlagger.FlaggerInputError, match = 'missing'):
+        akiFlagger.AKIFlagger().returnAKIpatients(cohort(num_patients = 5).drop(columns = column))
+
+def test_missing_demographics_for_egfr(cohort):
+    with pytest.raises(akiFlagger.FlaggerInputError):
+        akiFlagger.AKIFlagger(HB_trumping = True, eGFR_impute = True).returnAKIpatients(cohort(num_patients = 5))
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import akiFlagger
+
+WINDOWS = [dict(start = '2020-03-01'), dict(end = '2020-02-15'), dict(start = '2020-03-01', end = '2020-04-15')]
+
+@pytest.mark.parametrize('settings', [dict(), dict(HB_trumping = True), dict(padding = None, pad1time = '10hours', pad2time = '1day')])
+@pytest.mark.parametrize('window', WINDOWS)
+def test_window_matches_full_history(cohort, settings, window):
+    df = cohort(num_patients = 150)
+    flagger = akiFlagger.AKIFlagger(**settings)
+    full = flagger.returnAKIpatients(df.copy())
+    result = flagger.returnAKIpatients(df.copy(), **window)
+    times = full.index.get_level_values('time')
+    lo, hi = pd.Timestamp(window.get('start', times.min())), pd.Timestamp(window.get('end', times.max()))
+    expected = full[(times >= lo) & (times <= hi)]
+    assert 0 < len(result) < len(full)
+    pd.testing.assert_series_equal(result['aki'], expected['aki'])
+
+def test_window_reports_positions_in_the_input(cohort):
+    df = cohort(num_patients = 50)
+    row = len(df) - 5 # Inside the window
+    df.loc[row, 'creatinine'] = np.nan
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        akiFlagger.AKIFlagger().returnAKIpatients(df.copy(), start = df.loc[row, 'time'] - pd.Timedelta('1day'))
+    assert error.value.rows['creatinine is null'].tolist() == [row]
+
+def test_window_reports_positions_in_the_arrow_input(cohort):
+    pa = pytest.importorskip('pyarrow')
+    df = cohort(num_patients = 50)
+    row = len(df) - 5
+    df.loc[row, 'creatinine'] = np.nan
+    with pytest.raises(akiFlagger.FlaggerInputError) as error:
+        akiFlagger.AKIFlagger().returnAKIpatientsArrow(pa.Table.from_pandas(df, preserve_index = False), start = df.loc[row, 'time'] - pd.Timedelta('1day'))
+    assert error.value.rows['creatinine is null'].tolist() == [row]